@@ -44,11 +44,12 @@ function SchemaViewer({ dbDetails }) {
         <h3 className="text-lg font-semibold text-gray-900 mb-4">Database Browser</h3>
         <div className="space-y-8 mb-28">
           {tableNames.map((tableName) => {
-            const { content } = dbDetails[tableName];
+            const { content, row_count } = dbDetails[tableName];
             return (
               <div key={tableName} className="bg-white p-4 rounded-lg shadow-sm border border-gray-200">
                 <h4 className="text-lg font-bold text-blue-700 mb-2">{tableName}</h4>
                 {content.rows.length > 0 ? ( <SimpleTable headers={content.headers} rows={content.rows} /> ) : ( <p className="text-sm text-gray-500 mt-2">This table is empty.</p> )}
+                {row_count > content.rows.length && ( <p className="text-xs text-gray-500 mt-2">Showing first {content.rows.length} of {row_count} rows.</p> )}
               </div>
             );
           })}
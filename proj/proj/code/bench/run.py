@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+# --- Benchmark harness ---
+# Measures the hot paths against the versioned corpus in bench/corpus_v*.json:
+#   manual  - manualFunction.nl2sql alone, cold (memo cleared) and warm
+#   ai      - translate_query for statements the manual parser can't handle,
+#             answered by StubModel with --ai-latency seconds per model call;
+#             "ai_cold" misses the translation cache, "ai_cached" hits it
+#   e2e     - GET /process through the ASGI app with --concurrency requests
+#             in flight, against a synthetic database (bench/synthetic.py)
+#   formats - one full page of users (RESULT_MAX_ROWS rows) fetched from
+#             GET /process in each response format (functions/response_format),
+#             one request at a time; the result cache keeps SQLite out of it
+# Results (throughput and p50/p95/p99 latency per suite) are written as JSON;
+# pass an earlier file to --compare to see the change.
+#
+#   cd proj/proj/code && python -m bench.run --output bench_results.json
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_CORPUS = os.path.join(BENCH_DIR, "corpus_v1.json")
+SUITES = ("manual", "ai", "e2e", "formats")
+FORMATS = ("json", "rows", "columnar", "msgpack", "arrow")
+FORMAT_QUERY = "show * from users"
+
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def percentile(sorted_values, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, seconds: float, **extra):
+    """Throughput and latency percentiles (in ms) for one suite."""
+    latencies = sorted(latencies)
+    result = {
+        "count": len(latencies),
+        "seconds": round(seconds, 4),
+        "throughput_per_s": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "max_ms": round(latencies[-1] * 1000, 4) if latencies else 0.0,
+    }
+    result.update(extra)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=CODE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Manual parser ---
+
+def bench_manual(statements, rounds: int):
+    from functions import manualFunction
+
+    texts = [s["text"] for s in statements]
+    mismatches = [
+        s["id"] for s in statements
+        if s["expected_sql"] is not None and manualFunction.nl2sql_each([s["text"]])[0] != s["expected_sql"]
+    ]
+    results = {}
+    for name, clear in (("manual_cold", True), ("manual_warm", False)):
+        latencies = []
+        manualFunction._translate.cache_clear()
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in texts:
+                if clear:
+                    manualFunction._translate.cache_clear()
+                t0 = time.perf_counter()
+                manualFunction.nl2sql([text])
+                latencies.append(time.perf_counter() - t0)
+        results[name] = summarize(latencies, time.perf_counter() - start, mismatches=mismatches)
+    return results
+
+
+# --- AI path ---
+
+async def _run_concurrently(count: int, concurrency: int, fn):
+    """Calls `await fn(i)` for i in range(count) with at most `concurrency` in flight.
+
+    Returns (latencies, seconds, results).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = [0.0] * count
+    results = [None] * count
+
+    async def one(i):
+        async with semaphore:
+            t0 = time.perf_counter()
+            results[i] = await fn(i)
+            latencies[i] = time.perf_counter() - t0
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies, time.perf_counter() - start, results
+
+
+async def bench_ai(statements, db_path: str, requests: int, concurrency: int, latency: float):
+    from functions import ai_models
+    from routes import process
+
+    questions = [s["text"] for s in statements if s["intent"] == "unknown"]
+    stub = ai_models.StubModel(latency)
+    ai_models.set_model(stub)
+    # A run label keeps cold questions out of caches left by earlier runs.
+    label = str(time.time_ns())
+
+    def question(i):
+        return f"{questions[i % len(questions)]} {label} {i}"
+
+    async def translate(i):
+        sql, origin, error, fingerprint = await process.translate_query(question(i), db_path, None)
+        # The app only caches a translation once its SQL has run; the stub's
+        # SQL always runs, so it is stored without executing it here.
+        await process.remember_translation(question(i), fingerprint, sql)
+        return sql, origin, error
+
+    results = {}
+    latencies, seconds, answers = await _run_concurrently(requests, concurrency, translate)
+    results["ai_cold"] = summarize(
+        latencies, seconds,
+        errors=sum(1 for _, _, error in answers if error),
+        model_calls=stub.calls,
+        stub_latency_s=latency,
+    )
+
+    calls_before = stub.calls
+    latencies, seconds, answers = await _run_concurrently(requests, concurrency, translate)
+    results["ai_cached"] = summarize(
+        latencies, seconds,
+        errors=sum(1 for _, _, error in answers if error),
+        model_calls=stub.calls - calls_before,
+        cache_hits=sum(1 for _, origin, _ in answers if origin == "ai_cache"),
+    )
+    return results
+
+
+# --- End to end ---
+
+async def bench_e2e(statements, db_path: str, requests: int, concurrency: int, include_writes: bool):
+    import httpx
+    import main
+
+    texts = [s["text"] for s in statements if include_writes or s["intent"] in ("select", "unknown")]
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        with open(db_path, "rb") as f:
+            upload = await client.post("/upload_db/", files={"file": ("bench.db", f.read())})
+        session_token = upload.json()["session_token"]
+
+        async def call(i):
+            response = await client.get(
+                "/process", params={"session_token": session_token, "query": texts[i % len(texts)]}
+            )
+            return response.status_code, response.json(), response.headers.get("server-timing", "")
+
+        latencies, seconds, responses = await _run_concurrently(requests, concurrency, call)
+
+    http_errors = sum(1 for status, _, _ in responses if status != 200)
+    failed = sum(
+        1 for status, body, _ in responses
+        if status == 200 and ("error" in body or (isinstance(body.get("result"), str) and "Error" in body["result"]))
+    )
+    return {"e2e_process": summarize(
+        latencies, seconds, concurrency=concurrency, http_errors=http_errors, failed_statements=failed,
+        statements=len(texts), stage_mean_ms=stage_means([timing for _, _, timing in responses]),
+    )}
+
+
+def stage_means(server_timings):
+    """Mean milliseconds per stage over Server-Timing headers ("stage;dur=ms, ...")."""
+    totals = {}
+    for header in server_timings:
+        for part in filter(None, (p.strip() for p in header.split(","))):
+            stage, _, dur = part.partition(";dur=")
+            totals[stage] = totals.get(stage, 0.0) + float(dur or 0)
+    return {stage: round(total / len(server_timings), 4) for stage, total in totals.items()} if server_timings else {}
+
+
+# --- Response formats ---
+
+async def bench_formats(db_path: str, requests: int):
+    import httpx
+    import main
+    from functions import response_format
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        with open(db_path, "rb") as f:
+            upload = await client.post("/upload_db/", files={"file": ("bench.db", f.read())})
+        session_token = upload.json()["session_token"]
+        params = {"session_token": session_token, "query": FORMAT_QUERY}
+        await client.get("/process", params=params) # Fills the result cache
+
+        for name in FORMATS:
+            try:
+                response_format.negotiate(None, name)
+            except response_format.UnsupportedFormatError as e:
+                results[f"format_{name}"] = {"skipped": str(e)}
+                continue
+
+            async def call(i):
+                response = await client.get("/process", params=dict(params, format=name))
+                return response.status_code, len(response.content), response.headers.get("server-timing", "")
+
+            latencies, seconds, responses = await _run_concurrently(requests, 1, call)
+            results[f"format_{name}"] = summarize(
+                latencies, seconds,
+                http_errors=sum(1 for status, _, _ in responses if status != 200),
+                response_bytes=responses[0][1],
+                stage_mean_ms=stage_means([timing for _, _, timing in responses]),
+            )
+    return results
+
+
+# --- Reporting ---
+
+def compare(current, previous):
+    """Prints each suite's throughput and p95 against an earlier result file."""
+    print(f"{'suite':<14} {'throughput/s':>24} {'p95 ms':>24}")
+    for name, now in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if "skipped" in now:
+            print(f"{name:<14} skipped: {now['skipped']}")
+            continue
+        if not before or "skipped" in before:
+            print(f"{name:<14} {now['throughput_per_s']:>24} {now['p95_ms']:>24}")
+            continue
+
+        def change(key):
+            old, new = before[key], now[key]
+            pct = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            return f"{old} -> {new} ({pct})"
+
+        print(f"{name:<14} {change('throughput_per_s'):>24} {change('p95_ms'):>24}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the NL-to-SQL hot paths.")
+    parser.add_argument("--suites", default=",".join(SUITES), help="Comma-separated: " + ", ".join(SUITES))
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--rounds", type=int, default=200, help="Passes over the corpus for the manual suite")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests for the ai and e2e suites")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--ai-latency", type=float, default=0.05, help="Seconds per stub model call")
+    parser.add_argument("--rows", type=int, default=100000, help="Users in the synthetic database")
+    parser.add_argument("--extra-tables", type=int, default=0, help="Unrelated tables added to the schema")
+    parser.add_argument("--e2e-writes", action="store_true", help="Include INSERT/UPDATE/DELETE statements in e2e")
+    parser.add_argument("--format-requests", type=int, default=50, help="Requests per format for the formats suite")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    corpus = load_corpus(args.corpus)
+    statements = corpus["statements"]
+
+    work_dir = tempfile.mkdtemp(prefix="nl2sql-bench-")
+    # Everything the app writes goes to the scratch directory. Set before the
+    # app modules are imported, since they read their config at import time.
+    os.environ.update({
+        "AI_MODEL": "stub",
+        "DB_STORE_FOLDER": os.path.join(work_dir, "store"),
+        "TRANSLATION_CACHE_PATH": os.path.join(work_dir, "translation_cache.db"),
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, CODE_DIR)
+    from bench import synthetic
+
+    db_path = None
+    if {"ai", "e2e", "formats"} & set(suites):
+        print(f"Generating synthetic database ({args.rows} users)...")
+        db_path = synthetic.make_db(os.path.join(work_dir, "bench.db"), args.rows, args.extra_tables)
+
+    results = {}
+    for suite in suites:
+        print(f"Running {suite}...")
+        if suite == "manual":
+            results.update(bench_manual(statements, args.rounds))
+        elif suite == "ai":
+            results.update(asyncio.run(
+                bench_ai(statements, db_path, args.requests, args.concurrency, args.ai_latency)
+            ))
+        elif suite == "e2e":
+            results.update(asyncio.run(
+                bench_e2e(statements, db_path, args.requests, args.concurrency, args.e2e_writes)
+            ))
+        elif suite == "formats":
+            results.update(asyncio.run(bench_formats(db_path, args.format_requests)))
+
+    report = {
+        "corpus_version": corpus["version"],
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
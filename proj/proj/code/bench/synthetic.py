@@ -0,0 +1,61 @@
+import os
+import random
+import sqlite3
+
+# --- Synthetic benchmark databases ---
+# Same schema as sample_full.db (users, products, orders, reviews), filled
+# with deterministic pseudo-random rows so runs are comparable. extra_tables
+# adds unrelated wide tables, for measuring prompt building on big schemas.
+
+FIRST_NAMES = ("alice", "bob", "charlie", "dana", "eve", "frank", "grace", "heidi", "ivan", "judy")
+LAST_NAMES = ("johnson", "smith", "brown", "lee", "garcia", "miller", "davis", "wilson")
+PRODUCT_WORDS = ("lamp", "desk", "chair", "mug", "pen", "notebook", "cable", "monitor", "keyboard", "mouse")
+COMMENTS = ("great", "ok", "bad", "excellent", "would buy again", "broke after a week")
+
+
+def make_db(path: str, users: int = 10000, extra_tables: int = 0, seed: int = 1) -> str:
+    """Creates (or replaces) a database at path. Returns path."""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    products = max(1, users // 10)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript("""
+            CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER);
+            CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price REAL);
+            CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, product_id INTEGER, quantity INTEGER,
+                FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(product_id) REFERENCES products(id));
+            CREATE TABLE reviews (id INTEGER PRIMARY KEY, user_id INTEGER, product_id INTEGER, rating INTEGER, comment TEXT,
+                FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(product_id) REFERENCES products(id));
+        """)
+        conn.executemany(
+            "INSERT INTO users (id, name, email, age) VALUES (?, ?, ?, ?);",
+            (
+                (i, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"user{i}@example.com", rng.randint(18, 80))
+                for i in range(1, users + 1)
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO products (id, name, price) VALUES (?, ?, ?);",
+            ((i, f"{rng.choice(PRODUCT_WORDS)} {i}", round(rng.uniform(1, 500), 2)) for i in range(1, products + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO orders (user_id, product_id, quantity) VALUES (?, ?, ?);",
+            ((rng.randint(1, users), rng.randint(1, products), rng.randint(1, 5)) for _ in range(users * 2)),
+        )
+        conn.executemany(
+            "INSERT INTO reviews (user_id, product_id, rating, comment) VALUES (?, ?, ?, ?);",
+            (
+                (rng.randint(1, users), rng.randint(1, products), rng.randint(1, 5), rng.choice(COMMENTS))
+                for _ in range(users)
+            ),
+        )
+        for i in range(extra_tables):
+            conn.execute(
+                f"CREATE TABLE metrics_{i} (id INTEGER PRIMARY KEY, region_code TEXT, metric_{i} REAL, recorded_at TEXT);"
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return path
@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+# --- AI call dispatcher ---
+# Coalesces AI fallback calls before they reach the model:
+#   * single-flight: concurrent requests for the same (group, key) share one
+#     in-flight call instead of each calling the model;
+#   * micro-batching: distinct questions for the same group that arrive
+#     within AI_BATCH_WINDOW seconds are sent as one multi-question call
+#     (at most AI_BATCH_MAX questions per call).
+# A group is whatever makes questions answerable together (the schema
+# fingerprint). The dispatcher itself is model-agnostic: it is given an async
+# run_batch(context, questions) -> list of answers, one per question.
+
+AI_BATCH_WINDOW = float(os.getenv("AI_BATCH_WINDOW", "0.02"))
+AI_BATCH_MAX = int(os.getenv("AI_BATCH_MAX", "8"))
+
+
+class AIDispatcher:
+    def __init__(self, run_batch, window: float = AI_BATCH_WINDOW, max_batch: int = AI_BATCH_MAX):
+        self._run_batch = run_batch
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._inflight = {} # (group, key) -> Future shared by every waiter
+        self._pending = {} # group -> (context, [(key, question, future)]) waiting for the window
+        self._timers = {} # group -> TimerHandle that flushes the pending batch
+        self._tasks = set() # Running model calls (held so they aren't garbage collected)
+        self.stats = {"requests": 0, "coalesced": 0, "model_calls": 0, "batched_questions": 0}
+
+    async def submit(self, group, key, question: str, context):
+        """Answer for one question; joins an identical in-flight call if there is one."""
+        self.stats["requests"] += 1
+        inflight_key = (group, key)
+        future = self._inflight.get(inflight_key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[inflight_key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+            self._enqueue(group, key, question, context, future)
+        # Shielded so one waiter giving up doesn't cancel the call for the rest.
+        return await asyncio.shield(future)
+
+    def _enqueue(self, group, key, question, context, future):
+        if self.window <= 0 or self.max_batch == 1:
+            self._launch(context, [(key, question, future)])
+            return
+        _, items = self._pending.setdefault(group, (context, []))
+        items.append((key, question, future))
+        if len(items) >= self.max_batch:
+            self._flush(group)
+        elif group not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[group] = loop.call_later(self.window, self._flush, group)
+
+    def _flush(self, group):
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        context, items = self._pending.pop(group, (None, []))
+        if items:
+            self._launch(context, items)
+
+    def _launch(self, context, items):
+        task = asyncio.get_running_loop().create_task(self._call(context, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, context, items):
+        self.stats["model_calls"] += 1
+        if len(items) > 1:
+            self.stats["batched_questions"] += len(items)
+        try:
+            answers = await self._run_batch(context, [question for _, question, _ in items])
+        except asyncio.CancelledError:
+            for _, _, future in items:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), answer in zip(items, answers):
+            if not future.done():
+                future.set_result(answer)
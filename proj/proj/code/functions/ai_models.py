@@ -0,0 +1,94 @@
+import logging
+import os
+import re
+import threading
+import time
+
+# --- AI model backends ---
+# Everything that talks to an LLM goes through a model object with a single
+# blocking generate(prompt, timeout) -> str method. AI_MODEL picks the
+# backend: "gemini" (default) calls the Gemini API; "stub" answers locally
+# and deterministically so the AI path can be tested and benchmarked offline.
+
+log = logging.getLogger(__name__)
+
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-preview-09-2025'
+
+
+class GeminiModel:
+    def __init__(self):
+        import google.generativeai as genai # Gemini API; only needed for this backend
+
+        # Configure Gemini API using the key from .env
+        try:
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                log.warning("GOOGLE_API_KEY not found in .env file. AI function will fail.")
+                # Attempt to configure anyway, but API calls will likely fail later.
+                genai.configure(api_key="MISSING_KEY") # Use a placeholder
+            else:
+                genai.configure(api_key=api_key)
+        except Exception as e:
+            log.error("Error configuring Gemini API: %s", e)
+            # For now, we'll let it proceed, but AI calls will fail.
+            genai.configure(api_key="CONFIGURATION_ERROR")
+        self._model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        return self._model.generate_content(prompt, request_options={"timeout": timeout}).text
+
+
+class StubModel:
+    """Offline stand-in for the LLM.
+
+    Answers every instruction in the prompt with a SELECT that echoes the
+    instruction back, after sleeping `latency` seconds per call. Handles both
+    single-question and numbered multi-question prompts, and counts calls so
+    coalescing and batching can be measured.
+    """
+
+    _SINGLE_RE = re.compile(r'Instruction: "(.*)"')
+    _NUMBERED_RE = re.compile(r'^\s*(\d+)\. "(.*)"\s*$', re.MULTILINE)
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def answer(instruction: str) -> str:
+        return "SELECT '" + instruction.replace("'", "''") + "' AS instruction;"
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        numbered = self._NUMBERED_RE.findall(prompt)
+        if numbered:
+            return "\n".join(f"### {n}\n{self.answer(q)}" for n, q in numbered)
+        single = self._SINGLE_RE.search(prompt)
+        return self.answer(single.group(1) if single else "")
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """The configured model, created on first use (after .env has been loaded)."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            if os.getenv("AI_MODEL", "gemini").lower() == "stub":
+                _model = StubModel(float(os.getenv("AI_STUB_LATENCY", "0")))
+            else:
+                _model = GeminiModel()
+        return _model
+
+
+def set_model(model):
+    """Swaps the backend, e.g. for a StubModel in benchmarks."""
+    global _model
+    with _model_lock:
+        _model = model
@@ -0,0 +1,186 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from functions import schema_cache
+
+# --- DB browser ---
+# Table contents are read a page at a time with keyset pagination on rowid
+# ("WHERE rowid > ? ORDER BY rowid LIMIT ?"), so each page costs an index seek
+# no matter how deep into the table it is, and nothing ever holds a whole
+# table in memory. WITHOUT ROWID tables fall back to LIMIT/OFFSET.
+
+BROWSE_PAGE_SIZE = int(os.getenv("BROWSE_PAGE_SIZE", "500"))
+BROWSE_MAX_PAGE_SIZE = int(os.getenv("BROWSE_MAX_PAGE_SIZE", "5000"))
+STREAM_FETCH_SIZE = 1000 # Rows pulled per fetchmany while streaming
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "4096")) # Tables whose row counts are kept
+
+_count_cache = OrderedDict() # (db_path, table) -> (file_stamp, row_count), least recently used first
+_count_lock = threading.Lock()
+
+
+class UnknownTableError(ValueError):
+    pass
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def clamp_page_size(limit) -> int:
+    if not limit or limit <= 0:
+        return BROWSE_PAGE_SIZE
+    return min(limit, BROWSE_MAX_PAGE_SIZE)
+
+
+def list_tables(db_path: str, conn: sqlite3.Connection = None):
+    """Browsable tables and their column schema, without touching any rows."""
+    tables = {}
+    for table_name, columns_data in schema_cache.get_schema(db_path, conn).items():
+        if not table_name.replace('_', '').isalnum(): continue
+        tables[table_name] = [{"name": col[1], "type": col[2]} for col in columns_data]
+    return tables
+
+
+def _check_table(db_path: str, table: str, conn: sqlite3.Connection):
+    if table not in list_tables(db_path, conn):
+        raise UnknownTableError(f"Unknown table: {table}")
+
+
+def _has_rowid(cursor, table: str) -> bool:
+    try:
+        cursor.execute(f"SELECT rowid FROM {quote_ident(table)} LIMIT 0;")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _file_stamp(db_path: str):
+    """Changes whenever the DB (or its WAL) is written; used to validate cached counts."""
+    stamp = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def row_count(db_path: str, table: str, conn: sqlite3.Connection) -> int:
+    """COUNT(*) for a table, cached until the database file changes."""
+    key = (db_path, table)
+    stamp = _file_stamp(db_path)
+    with _count_lock:
+        entry = _count_cache.get(key)
+        if entry and entry[0] == stamp:
+            _count_cache.move_to_end(key)
+            return entry[1]
+    count = conn.execute(f"SELECT COUNT(*) FROM {quote_ident(table)};").fetchone()[0]
+    with _count_lock:
+        _count_cache[key] = (stamp, count)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return count
+
+
+def invalidate(db_path: str):
+    """Drops the cached row counts for db_path (e.g. when its file is removed)."""
+    with _count_lock:
+        for key in [key for key in _count_cache if key[0] == db_path]:
+            del _count_cache[key]
+
+
+def get_schema_with_counts(db_path: str, conn: sqlite3.Connection):
+    tables = list_tables(db_path, conn)
+    return {
+        table_name: {"schema": columns, "row_count": row_count(db_path, table_name, conn)}
+        for table_name, columns in tables.items()
+    }
+
+
+def _rowid_filter(after):
+    # rowids may be negative, so "from the start" must not be "rowid > 0".
+    if after is None:
+        return "", ()
+    return " WHERE rowid > ?", (after,)
+
+
+def fetch_page(db_path: str, table: str, conn: sqlite3.Connection, after: int = None, limit: int = None):
+    """One page of rows. Pass the returned next_after back in to get the next page.
+
+    next_after is None once the table is exhausted.
+    """
+    _check_table(db_path, table, conn)
+    limit = clamp_page_size(limit)
+    cursor = conn.cursor()
+    quoted = quote_ident(table)
+
+    if _has_rowid(cursor, table):
+        # Fetch one extra row to learn whether another page exists.
+        where, params = _rowid_filter(after)
+        cursor.execute(f"SELECT rowid, * FROM {quoted}{where} ORDER BY rowid LIMIT ?;", params + (limit + 1,))
+        headers = [d[0] for d in cursor.description][1:]
+        rows = cursor.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_after = rows[-1][0] if has_more else None
+        rows = [row[1:] for row in rows]
+    else:
+        after = after or 0
+        cursor.execute(f"SELECT * FROM {quoted} LIMIT ? OFFSET ?;", (limit + 1, after))
+        headers = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_after = after + limit if has_more else None
+
+    return {"headers": headers, "rows": rows, "next_after": next_after}
+
+
+def _json_default(value):
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(obj) -> str:
+    return json.dumps(obj, default=_json_default, separators=(",", ":"))
+
+
+def open_table(db_path: str, table: str, conn: sqlite3.Connection, after: int = None):
+    """Cursor over a table's rows (from after on), for iter_table_ndjson.
+
+    Raises UnknownTableError or sqlite3.Error before anything has been sent.
+    """
+    _check_table(db_path, table, conn)
+    cursor = conn.cursor()
+    try:
+        quoted = quote_ident(table)
+        if _has_rowid(cursor, table):
+            where, params = _rowid_filter(after)
+            cursor.execute(f"SELECT * FROM {quoted}{where} ORDER BY rowid;", params)
+        else:
+            cursor.execute(f"SELECT * FROM {quoted} LIMIT -1 OFFSET ?;", (after or 0,))
+    except Exception:
+        cursor.close()
+        raise
+    return cursor
+
+
+def iter_table_ndjson(table: str, cursor: sqlite3.Cursor):
+    """Yields a header line and then one JSON array per row of an open_table cursor, as NDJSON.
+
+    Memory use is bounded by STREAM_FETCH_SIZE. Closing the cursor and its
+    connection is left to the caller (see db_pool.StreamBody).
+    """
+    yield dumps({"table": table, "headers": [d[0] for d in cursor.description]}) + "\n"
+    while True:
+        rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+        if not rows:
+            break
+        yield "".join(dumps(row) + "\n" for row in rows)
@@ -0,0 +1,265 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from functions import schema_cache
+from functions.db_browser import quote_ident
+
+# --- Query plan guardrails ---
+# A SELECT's plan is checked before it runs. EXPLAIN QUERY PLAN shows which
+# tables SQLite will read in full ("SCAN t") and whether a join (or a
+# correlated subquery) repeats a full scan for every row of another table, i.e.
+# a Cartesian product. Table sizes are estimated from max(rowid). A Cartesian
+# product expected to visit more than QUERY_MAX_JOIN_ROWS rows is rejected
+# (QUERY_GUARD=reject) or wrapped in a LIMIT (QUERY_GUARD=limit);
+# QUERY_GUARD=warn only reports it. Whatever the plan, a statement is stopped
+# after QUERY_STEP_BUDGET SQLite VM steps or QUERY_TIME_BUDGET seconds.
+# QUERY_GUARD=off turns all of this off.
+# Full scans of large tables, with the columns the query filters them on, are
+# counted per database file. The index advisor (routes/advisor.py) turns
+# recurring ones into CREATE INDEX statements.
+
+QUERY_GUARD = os.getenv("QUERY_GUARD", "reject").lower() # reject, limit, warn or off
+QUERY_MAX_JOIN_ROWS = int(os.getenv("QUERY_MAX_JOIN_ROWS", str(10_000_000)))
+QUERY_SCAN_WARN_ROWS = int(os.getenv("QUERY_SCAN_WARN_ROWS", "100000")) # Smaller full scans aren't reported
+QUERY_STEP_BUDGET = int(os.getenv("QUERY_STEP_BUDGET", str(1_000_000_000))) # 0 for no step limit
+QUERY_TIME_BUDGET = float(os.getenv("QUERY_TIME_BUDGET", "30")) # Seconds; 0 for no time limit
+INDEX_ADVISOR_MAX_COLUMNS = 3
+SCAN_PATTERN_DBS = 1024 # Databases whose scan patterns are kept
+
+_FULL_SCAN_RE = re.compile(r"^SCAN (\S+)(?: USING (?:COVERING )?INDEX \S+)?$")
+_AUTO_INDEX_RE = re.compile(r"^SEARCH (\S+) USING AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX \(([^)]*)\)")
+_TABLE_REF_RE = re.compile(
+    r'(?:\bFROM|\bJOIN|,)\s+("(?:[^"]|"")+"|\w+)(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|USING|INNER|LEFT|RIGHT|FULL'
+    r'|OUTER|CROSS|NATURAL|GROUP|ORDER|HAVING|LIMIT|UNION|EXCEPT|INTERSECT|WINDOW)\b)(\w+))?',
+    re.IGNORECASE,
+)
+_FILTER_START_RE = re.compile(r"\b(?:WHERE|ON)\b", re.IGNORECASE)
+_COMPARISON_RE = re.compile(
+    r"(?:\b(\w+)\.)?\b(\w+)\s*(==|=|<=|>=|<|>|\bIN\b|\bIS\b(?!\s+NOT)|\bBETWEEN\b)\s*(\w+\.\w+)?", re.IGNORECASE
+)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+_patterns = OrderedDict() # db_path -> Counter({(table, columns): full scans})
+_patterns_lock = threading.Lock()
+
+
+class QueryRejectedError(ValueError):
+    pass
+
+
+class BudgetExceededError(QueryRejectedError):
+    pass
+
+
+class PlanCheck:
+    """Outcome of check_select: the SQL to run and warnings for the response."""
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.warnings = []
+        self.full_scans = [] # (table, estimated rows)
+        self.cartesian = False
+        self.limited = False
+
+
+class Budget:
+    """Progress handler that stops a statement once it runs over the step or time budget."""
+
+    def __init__(self, steps_per_call: int):
+        self.calls_left = QUERY_STEP_BUDGET // steps_per_call if QUERY_STEP_BUDGET > 0 else None
+        self.deadline = time.monotonic() + QUERY_TIME_BUDGET if QUERY_TIME_BUDGET > 0 else None
+        self.exceeded = None # Why the statement was stopped
+
+    def progress_handler(self) -> int:
+        if self.calls_left is not None:
+            self.calls_left -= 1
+            if self.calls_left < 0:
+                self.exceeded = f"{QUERY_STEP_BUDGET:,} VM steps"
+                return 1
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.exceeded = f"{QUERY_TIME_BUDGET:g}s"
+            return 1
+        return 0
+
+
+def new_budget(steps_per_call: int):
+    """A Budget for one statement, or None when the guard is off."""
+    return Budget(steps_per_call) if QUERY_GUARD != "off" else None
+
+
+def _table_aliases(sql: str, tables) -> dict:
+    """{name used in the query: table} for the tables the query reads."""
+    aliases = {table: table for table in tables}
+    for name, alias in _TABLE_REF_RE.findall(sql):
+        if name.startswith('"'):
+            name = name[1:-1].replace('""', '"')
+        if name in tables and alias:
+            aliases[alias] = name
+    return aliases
+
+
+def _filter_columns(sql: str, table: str, aliases: dict, columns) -> tuple:
+    """Columns of table that the query compares with values: equality tests first, then ranges.
+
+    Join conditions (a column compared with another table's column) are left
+    out: an index for those shows up as an automatic index in the plan.
+    """
+    text = _STRING_RE.sub("''", sql)
+    start = _FILTER_START_RE.search(text)
+    if start is None:
+        return ()
+    equal, ranged = [], []
+    for qualifier, column, op, other_column in _COMPARISON_RE.findall(text[start.start():]):
+        if column not in columns or other_column or (qualifier and aliases.get(qualifier) != table):
+            continue
+        target = equal if op.upper() in ("=", "==", "IN", "IS") else ranged
+        if column not in equal and column not in ranged:
+            target.append(column)
+    return tuple((equal + ranged)[:INDEX_ADVISOR_MAX_COLUMNS])
+
+
+def _estimate_rows(conn, table: str, estimates: dict) -> int:
+    if table not in estimates:
+        try:
+            estimates[table] = conn.execute(f"SELECT max(rowid) FROM {quote_ident(table)};").fetchone()[0] or 0
+        except sqlite3.Error:
+            estimates[table] = 0 # WITHOUT ROWID: size unknown
+    return estimates[table]
+
+
+def check_select(conn, db_path: str, sql: str, limit: int) -> PlanCheck:
+    """Checks a SELECT's query plan on conn. Raises QueryRejectedError if it must not run.
+
+    With QUERY_GUARD=limit an over-large Cartesian product is wrapped to
+    return at most `limit` rows instead (see PlanCheck.sql).
+    """
+    check = PlanCheck(sql)
+    if QUERY_GUARD == "off":
+        return check
+    schema = schema_cache.get_schema(db_path, conn)
+    aliases = _table_aliases(sql, schema)
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    nodes = {node_id: (parent, detail) for node_id, parent, _, detail in plan}
+    estimates = {}
+
+    loops = {} # parent id -> [(table or None, is full scan)]
+    scanned = Counter() # (table, filter columns) -> full scans in this query
+    for node_id, parent, _, detail in plan:
+        full = _FULL_SCAN_RE.match(detail)
+        auto = _AUTO_INDEX_RE.match(detail)
+        if full or auto or detail.startswith("SEARCH "):
+            name = (full or auto).group(1) if (full or auto) else detail.split()[1]
+            table = aliases.get(name)
+            loops.setdefault(parent, []).append((table, bool(full)))
+            if table is None:
+                continue
+            columns = {col[1] for col in schema[table]}
+            if auto:
+                # SQLite builds this index on every run: it is missing.
+                filters = tuple(c.split("=")[0].strip() for c in auto.group(2).split(" AND "))
+                scanned[(table, tuple(c for c in filters if c in columns))] += 1
+            elif full and _estimate_rows(conn, table, estimates) >= QUERY_SCAN_WARN_ROWS:
+                check.full_scans.append((table, estimates[table]))
+                scanned[(table, _filter_columns(sql, table, aliases, columns))] += 1
+
+    def visits(parent) -> int:
+        """Rows read by the loops under parent, counting outer loops for correlated subqueries."""
+        rows = 1
+        for table, full in loops.get(parent, ()):
+            if full and table is not None:
+                rows *= max(1, _estimate_rows(conn, table, estimates))
+        node = nodes.get(parent)
+        if node is not None and node[1].startswith("CORRELATED"):
+            return rows * visits(node[0])
+        return rows
+
+    worst, product_tables = 0, None
+    for parent, group in loops.items():
+        node = nodes.get(parent)
+        nested = any(full for _, full in group[1:]) or (
+            node is not None and node[1].startswith("CORRELATED") and any(full for _, full in group)
+        )
+        if nested:
+            check.cartesian = True
+            rows = visits(parent)
+            if rows > worst:
+                worst, product_tables = rows, [t for t, full in group if full and t]
+    _record(db_path, scanned)
+
+    for table, rows in check.full_scans:
+        check.warnings.append(f"Full scan of {table} (about {rows:,} rows).")
+    if check.cartesian:
+        tables = " x ".join(product_tables or ["a subquery"])
+        message = f"Cartesian product ({tables}) visits about {worst:,} rows"
+        if worst > QUERY_MAX_JOIN_ROWS and QUERY_GUARD == "reject":
+            raise QueryRejectedError(f"{message}. Add a join condition or a WHERE clause.")
+        if worst > QUERY_MAX_JOIN_ROWS and QUERY_GUARD == "limit":
+            check.sql = f"SELECT * FROM (\n{sql.strip().rstrip(';')}\n) LIMIT {limit};"
+            check.limited = True
+            message += f"; result limited to {limit:,} rows"
+        check.warnings.append(message + ".")
+    return check
+
+
+# --- Scan patterns ---
+
+def _record(db_path: str, scanned: Counter):
+    if not scanned:
+        return
+    with _patterns_lock:
+        counts = _patterns.get(db_path)
+        if counts is None:
+            counts = _patterns[db_path] = Counter()
+        _patterns.move_to_end(db_path)
+        counts.update(scanned)
+        while len(_patterns) > SCAN_PATTERN_DBS:
+            _patterns.popitem(last=False)
+
+
+def scan_patterns(db_path: str):
+    """[(table, filter columns, full scans)] recorded for db_path, most frequent first."""
+    with _patterns_lock:
+        counts = Counter(_patterns.get(db_path, ()))
+    return [(table, columns, n) for (table, columns), n in counts.most_common()]
+
+
+def forget(db_path: str):
+    """Drops db_path's scan patterns (e.g. when its file is removed)."""
+    with _patterns_lock:
+        _patterns.pop(db_path, None)
+
+
+def _indexed_prefixes(conn, table: str):
+    """Leading columns of every index on table."""
+    prefixes = []
+    for index in conn.execute(f"PRAGMA index_list({quote_ident(table)});").fetchall():
+        columns = [row[2] for row in conn.execute(f"PRAGMA index_info({quote_ident(index[1])});").fetchall()]
+        prefixes.append(tuple(columns))
+    return prefixes
+
+
+def index_advice(conn, db_path: str, min_scans: int = 1):
+    """CREATE INDEX suggestions for the recurring full scans of db_path.
+
+    A pattern is skipped when it has no filter columns to index, or an
+    existing index already starts with its columns (SQLite chose to scan).
+    """
+    advice = []
+    for table, columns, scans in scan_patterns(db_path):
+        if scans < min_scans or not columns:
+            continue
+        if any(prefix[:len(columns)] == columns for prefix in _indexed_prefixes(conn, table)):
+            continue
+        name = "idx_" + re.sub(r"\W", "_", "_".join((table,) + columns))
+        advice.append({
+            "table": table,
+            "columns": list(columns),
+            "full_scans": scans,
+            "sql": f"CREATE INDEX IF NOT EXISTS {quote_ident(name)} ON {quote_ident(table)} "
+                   f"({', '.join(quote_ident(c) for c in columns)});",
+        })
+    return advice
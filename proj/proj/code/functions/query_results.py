@@ -0,0 +1,85 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+from functions.db_browser import dumps
+from globals import session_store
+
+# --- Bounded query results ---
+# A SELECT never returns more than a fixed number of rows per response. When
+# it is cut short the response carries a continuation token; handing it back
+# re-runs the statement wrapped in LIMIT/OFFSET to get the next page. Tokens
+# are stateless (the SQL and offset travel inside them) and HMAC-signed so a
+# client can't use them to smuggle arbitrary SQL. The key is
+# RESULT_TOKEN_SECRET, or else one kept in the session store, so a token
+# issued by one worker process is accepted by the others.
+
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "10000"))
+RESULT_STREAM_MAX_ROWS = int(os.getenv("RESULT_STREAM_MAX_ROWS", "1000000"))
+RESULT_FETCH_SIZE = 1000 # Rows pulled per fetchmany
+_TOKEN_SECRET = (os.getenv("RESULT_TOKEN_SECRET") or session_store.secret("result_token")).encode()
+
+
+class InvalidTokenError(ValueError):
+    pass
+
+
+def _sign(payload: bytes) -> str:
+    return hmac.new(_TOKEN_SECRET, payload, hashlib.sha256).hexdigest()
+
+
+def make_token(session_token: str, sql: str, offset: int) -> str:
+    payload = json.dumps({"s": session_token, "q": sql, "o": offset}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode("ascii") + "." + _sign(payload)
+
+
+def read_token(token: str, session_token: str):
+    """Returns (sql, offset) for a continuation token issued to this session."""
+    try:
+        encoded, signature = token.rsplit(".", 1)
+        payload = base64.urlsafe_b64decode(encoded.encode("ascii"))
+    except Exception:
+        raise InvalidTokenError("Malformed continuation token.")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidTokenError("Invalid continuation token.")
+    data = json.loads(payload)
+    if data["s"] != session_token:
+        raise InvalidTokenError("Continuation token belongs to another session.")
+    return data["q"], data["o"]
+
+
+def paged_sql(sql: str) -> str:
+    """Wraps a SELECT so it can be resumed with (OFFSET) parameters."""
+    # Newlines keep a trailing "-- comment" from swallowing the closing paren.
+    return f"SELECT * FROM (\n{sql.strip().rstrip(';')}\n) LIMIT -1 OFFSET ?;"
+
+
+def fetch_bounded(cursor, max_rows: int):
+    """Up to max_rows rows from an executed cursor, and whether more remain."""
+    rows = cursor.fetchmany(max_rows + 1)
+    if len(rows) > max_rows:
+        return rows[:max_rows], True
+    return rows, False
+
+
+def iter_ndjson(cursor, executed_sql: str, next_token_for, max_rows: int):
+    """Streams an executed SELECT as NDJSON.
+
+    The first line carries executed_sql and headers, then one JSON array per
+    row. If max_rows is hit, a final {"next_token": ...} line is written;
+    next_token_for(rows_sent) builds that token. Closing the cursor and its
+    connection is left to the caller (see db_pool.StreamBody).
+    """
+    headers = [d[0] for d in cursor.description] if cursor.description else []
+    yield dumps({"executed_sql": executed_sql, "headers": headers}) + "\n"
+    sent = 0
+    while sent < max_rows:
+        rows = cursor.fetchmany(min(RESULT_FETCH_SIZE, max_rows - sent))
+        if not rows:
+            return
+        sent += len(rows)
+        yield "".join(dumps(row) + "\n" for row in rows)
+    if cursor.fetchone() is not None:
+        yield dumps({"next_token": next_token_for(sent)}) + "\n"
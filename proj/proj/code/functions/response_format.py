@@ -0,0 +1,216 @@
+import base64
+import functools
+import json
+
+from fastapi.responses import Response
+
+from functions import telemetry
+from functions.db_browser import dumps
+
+try:
+    import orjson # Faster JSON encoding; the stdlib is used without it
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+# --- Response formats ---
+# Query and browser results are sent through FastAPI's generic JSON encoding
+# by default. A client can opt into a faster encoding, with the `format` query
+# parameter or the Accept header (a media type below):
+#   rows      the same JSON, encoded in one call (orjson when installed)
+#   columnar  JSON with each result table as "columns" (one array per
+#             column) plus "row_count", instead of "rows"
+#   msgpack   the columnar layout as MessagePack; BLOBs stay raw bytes
+#   arrow     an Arrow IPC stream of the result table; BLOBs stay raw bytes.
+#             A column whose values mix types (SQLite allows it) is a dense
+#             union with one child per storage class: integer, real, text,
+#             blob, null. The rest of the response (executed_sql,
+#             next_token, ...) is JSON in the schema metadata under "nl2sql".
+#             A response without exactly one result table (an error, a
+#             write, a batch) is sent as columnar JSON instead.
+# In the JSON formats BLOBs are base64 strings, as in NDJSON streams.
+
+MEDIA_TYPES = {
+    "rows": "application/json",
+    "columnar": "application/vnd.nl2sql.columnar+json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+_ACCEPTED = {
+    "application/vnd.nl2sql.columnar+json": "columnar",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+_REQUIRES = {"msgpack": ("msgpack", lambda: msgpack), "arrow": ("pyarrow", lambda: pyarrow)}
+
+
+class UnsupportedFormatError(ValueError):
+    pass
+
+
+def negotiate(request, format: str = None):
+    """The requested format: the format parameter, else the Accept header. None for the default JSON.
+
+    Raises UnsupportedFormatError for an unknown format, or one whose package isn't installed.
+    """
+    if format:
+        format = format.lower()
+        if format == "json":
+            return None
+        if format not in MEDIA_TYPES:
+            raise UnsupportedFormatError(f"Unknown format: {format}. Use one of json, {', '.join(MEDIA_TYPES)}.")
+    else:
+        accept = request.headers.get("accept", "") if request is not None else ""
+        media_types = (part.split(";")[0].strip().lower() for part in accept.split(","))
+        format = next((_ACCEPTED[m] for m in media_types if m in _ACCEPTED), None)
+        if format is None:
+            return None
+    package, module = _REQUIRES.get(format, (None, lambda: True))
+    if module() is None:
+        raise UnsupportedFormatError(f"The {format} format needs the {package} package on the server.")
+    return format
+
+
+def _is_table(obj) -> bool:
+    return isinstance(obj, dict) and "headers" in obj and "rows" in obj
+
+
+def _columns(headers, rows):
+    if not rows:
+        return [[] for _ in headers]
+    return [list(column) for column in zip(*rows)]
+
+
+def to_columnar(obj):
+    """Copy of obj with every result table ({"headers", "rows", ...}) in columnar layout."""
+    if _is_table(obj):
+        table = {key: to_columnar(value) for key, value in obj.items() if key != "rows"}
+        table["columns"] = _columns(obj["headers"], obj["rows"])
+        table["row_count"] = len(obj["rows"])
+        return table
+    if isinstance(obj, dict):
+        return {key: to_columnar(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [to_columnar(value) for value in obj]
+    return obj
+
+
+def _find_tables(obj, found):
+    if _is_table(obj):
+        found.append(obj)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _find_tables(value, found)
+    elif isinstance(obj, list):
+        for value in obj:
+            _find_tables(value, found)
+    return found
+
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_json(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default)
+    return dumps(obj).encode("utf-8")
+
+
+_STORAGE_CLASSES = {int: "integer", float: "real", str: "text", bytes: "blob", type(None): "null"}
+
+
+def _arrow_union(values):
+    """Dense union column with one child per SQLite storage class found in values."""
+    type_ids, offsets = [], []
+    children = {} # storage class -> (type id, values)
+    for value in values:
+        name = _STORAGE_CLASSES[type(value)]
+        if name not in children:
+            children[name] = (len(children), [])
+        type_id, child = children[name]
+        type_ids.append(type_id)
+        offsets.append(len(child))
+        child.append(value)
+    return pyarrow.UnionArray.from_dense(
+        pyarrow.array(type_ids, type=pyarrow.int8()),
+        pyarrow.array(offsets, type=pyarrow.int32()),
+        [pyarrow.array(child) for _, child in children.values()],
+        list(children),
+    )
+
+
+def _arrow_column(values):
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        # SQLite columns can mix types; Arrow columns can't.
+        return _arrow_union(values)
+
+
+def encode_arrow(payload, table) -> bytes:
+    """Arrow IPC stream of table, with the rest of payload as JSON schema metadata."""
+    columns = _columns(table["headers"], table["rows"])
+    # Duplicate names (e.g. "SELECT a.id, b.id") are fine in Arrow.
+    arrow_table = pyarrow.Table.from_arrays(
+        [_arrow_column(values) for values in columns], names=list(table["headers"])
+    )
+
+    def without_rows(obj):
+        if obj is table:
+            return {key: value for key, value in obj.items() if key != "rows"}
+        if isinstance(obj, dict):
+            return {key: without_rows(value) for key, value in obj.items()}
+        return obj
+
+    metadata = {"nl2sql": json.dumps(without_rows(payload), default=_json_default)}
+    arrow_table = arrow_table.replace_schema_metadata(metadata)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue().to_pybytes()
+
+
+def respond(payload, format: str = None):
+    """Response for an endpoint's result in the format from negotiate(), timed as "serialize"."""
+    if format is None or isinstance(payload, Response):
+        return telemetry.json_response(payload)
+    with telemetry.timer("serialize"):
+        if format == "rows":
+            return Response(encode_json(payload), media_type=MEDIA_TYPES["rows"])
+        if format == "arrow":
+            tables = _find_tables(payload, [])
+            if len(tables) == 1:
+                return Response(encode_arrow(payload, tables[0]), media_type=MEDIA_TYPES["arrow"])
+        columnar = to_columnar(payload)
+        if format == "msgpack":
+            return Response(msgpack.packb(columnar, use_bin_type=True), media_type=MEDIA_TYPES["msgpack"])
+        return Response(encode_json(columnar), media_type=MEDIA_TYPES["columnar"])
+
+
+def negotiated(endpoint):
+    """Decorator for async endpoints that return plain data and take `request` and `format` arguments.
+
+    Replaces telemetry.timed_json: the result is sent in the negotiated format.
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            format = negotiate(kwargs.get("request"), kwargs.get("format"))
+        except UnsupportedFormatError as e:
+            return telemetry.json_response({"error": str(e)})
+        return respond(await endpoint(*args, **kwargs), format)
+    return wrapper
@@ -0,0 +1,136 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.request import pathname2url
+
+# --- SELECT result cache ---
+# Repeated SELECTs (dashboards refreshing the same question) are answered from
+# memory while the database is unchanged. Entries are keyed on the database
+# file, the executed SQL and the page offset, and remember the database's
+# PRAGMA data_version when they were filled. data_version is read from a
+# long-lived "watcher" connection per file; it changes whenever any other
+# connection, in this process or another worker, commits a write. So a
+# cache hit costs one PRAGMA. The cache is an LRU bounded by
+# RESULT_CACHE_MAX_BYTES (estimated size of the rows held).
+# Keying on the file means sessions still sharing an unmodified upload (see
+# routes/db_store) share entries; a session that writes has its own file.
+
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_MAX_ENTRY_BYTES = RESULT_CACHE_MAX_BYTES // 8 # Bigger results aren't cached
+RESULT_CACHE_WATCHERS = 256 # Watcher connections kept open
+
+# SQL whose result can change without the database changing: calls to these
+# functions, or the CURRENT_* keywords. Columns named date, time, ... are fine.
+_VOLATILE_RE = re.compile(
+    r"\b(?:(?:random|randomblob|date|time|datetime|julianday|strftime|unixepoch|changes|total_changes"
+    r"|last_insert_rowid)\s*\(|current_(?:date|time|timestamp)\b)",
+    re.IGNORECASE,
+)
+
+_entries = OrderedDict() # (db_path, sql, offset) -> (data_version, result, size)
+_watchers = OrderedDict() # db_path -> (connection, lock)
+_bytes = 0
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0, "stale": 0, "stores": 0, "evictions": 0}
+
+
+def cacheable(sql: str) -> bool:
+    return not _VOLATILE_RE.search(sql)
+
+
+def _estimate_size(result) -> int:
+    size = 256 + sum(len(h) for h in result["headers"])
+    for row in result["rows"]:
+        size += 64 + 16 * len(row)
+        for value in row:
+            if isinstance(value, (str, bytes)):
+                size += len(value)
+    return size
+
+
+def _drop_entries(db_path: str):
+    """Forgets every entry for db_path. Caller holds _lock."""
+    global _bytes
+    for key in [k for k in _entries if k[0] == db_path]:
+        _bytes -= _entries.pop(key)[2]
+
+
+def _watcher(db_path: str):
+    """The watcher connection for db_path, opened on first use."""
+    with _lock:
+        watcher = _watchers.get(db_path)
+        if watcher is not None:
+            _watchers.move_to_end(db_path)
+            return watcher
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+    watcher = (sqlite3.connect(uri, uri=True, check_same_thread=False), threading.Lock())
+    with _lock:
+        existing = _watchers.get(db_path)
+        if existing is not None:
+            watcher[0].close()
+            return existing
+        _watchers[db_path] = watcher
+        while len(_watchers) > RESULT_CACHE_WATCHERS:
+            old_path, (old_conn, _) = _watchers.popitem(last=False)
+            old_conn.close()
+            # A new watcher's data_version isn't comparable with the old one's.
+            _drop_entries(old_path)
+    return watcher
+
+
+def data_version(db_path: str) -> int:
+    conn, conn_lock = _watcher(db_path)
+    with conn_lock:
+        return conn.execute("PRAGMA data_version;").fetchone()[0]
+
+
+def get(db_path: str, sql: str, offset: int = 0):
+    """Returns (cached result or None, current data_version) for the query."""
+    version = data_version(db_path)
+    key = (db_path, sql, offset)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == version:
+            _entries.move_to_end(key)
+            stats["hits"] += 1
+            return entry[1], version
+        if entry is not None:
+            global _bytes
+            _bytes -= _entries.pop(key)[2]
+            stats["stale"] += 1
+        stats["misses"] += 1
+    return None, version
+
+
+def put(db_path: str, sql: str, offset: int, version: int, result):
+    """Stores a SELECT result read at data_version `version` (as returned by get)."""
+    global _bytes
+    size = _estimate_size(result)
+    if size > RESULT_CACHE_MAX_ENTRY_BYTES:
+        return
+    key = (db_path, sql, offset)
+    with _lock:
+        if db_path not in _watchers:
+            return # Watcher was closed since get(); version may be stale
+        old = _entries.pop(key, None)
+        if old is not None:
+            _bytes -= old[2]
+        _entries[key] = (version, result, size)
+        _bytes += size
+        stats["stores"] += 1
+        while _bytes > RESULT_CACHE_MAX_BYTES and _entries:
+            _, (_, _, evicted_size) = _entries.popitem(last=False)
+            _bytes -= evicted_size
+            stats["evictions"] += 1
+
+
+def invalidate(db_path: str):
+    """Drops db_path's entries and closes its watcher, e.g. before the file is removed."""
+    with _lock:
+        _drop_entries(db_path)
+        watcher = _watchers.pop(db_path, None)
+    if watcher is not None:
+        with watcher[1]:
+            watcher[0].close()
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# --- Schema cache ---
+# Introspecting a database costs one sqlite_master scan plus one
+# PRAGMA table_info per table. The result only changes when DDL runs, which
+# SQLite records by bumping PRAGMA schema_version, so entries are keyed on the
+# file identity and validated against that counter on every read.
+
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", "64"))
+
+_cache = OrderedDict() # db_path -> (file_id, schema_version, schema, fingerprint, foreign_keys)
+_lock = threading.Lock()
+
+
+def _file_id(db_path: str):
+    st = os.stat(db_path)
+    return (st.st_dev, st.st_ino)
+
+
+def _introspect(cursor):
+    """Returns ({table_name: PRAGMA table_info rows}, {table_name: referenced table names})."""
+    schema = {}
+    foreign_keys = {}
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    for (table_name,) in cursor.fetchall():
+        quoted = table_name.replace('"', '""')
+        cursor.execute(f'PRAGMA table_info("{quoted}");')
+        schema[table_name] = cursor.fetchall()
+        cursor.execute(f'PRAGMA foreign_key_list("{quoted}");')
+        foreign_keys[table_name] = sorted({fk[2] for fk in cursor.fetchall()})
+    return schema, foreign_keys
+
+
+def _fingerprint(schema) -> str:
+    """Content hash of the schema: identical schemas in different files match."""
+    canonical = sorted((table, [(col[1], col[2]) for col in columns]) for table, columns in schema.items())
+    return hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+
+
+def get_schema(db_path: str, conn: sqlite3.Connection = None):
+    """Returns the cached schema for db_path, re-introspecting only if it changed.
+
+    The returned dict is shared between callers and must not be mutated.
+    Pass conn to reuse an open connection for the version check.
+    """
+    return _get_entry(db_path, conn)[2]
+
+
+def get_fingerprint(db_path: str, conn: sqlite3.Connection = None) -> str:
+    """Hash of table names, column names and column types for db_path."""
+    return _get_entry(db_path, conn)[3]
+
+
+def get_foreign_keys(db_path: str, conn: sqlite3.Connection = None):
+    """{table_name: [tables it references]} for db_path. Must not be mutated."""
+    return _get_entry(db_path, conn)[4]
+
+
+def _get_entry(db_path: str, conn: sqlite3.Connection = None):
+    file_id = _file_id(db_path)
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        version = cursor.execute("PRAGMA schema_version;").fetchone()[0]
+
+        with _lock:
+            entry = _cache.get(db_path)
+            if entry and entry[0] == file_id and entry[1] == version:
+                _cache.move_to_end(db_path)
+                return entry
+
+        schema, foreign_keys = _introspect(cursor)
+    finally:
+        if own_conn:
+            conn.close()
+
+    entry = (file_id, version, schema, _fingerprint(schema), foreign_keys)
+    with _lock:
+        _cache[db_path] = entry
+        _cache.move_to_end(db_path)
+        while len(_cache) > SCHEMA_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return entry
+
+
+def invalidate(db_path: str):
+    """Drops the cached schema for db_path (e.g. after DDL or when a session ends)."""
+    with _lock:
+        _cache.pop(db_path, None)
+
+
+def is_ddl(sql: str) -> bool:
+    return sql.lstrip().lower().startswith(("create", "alter", "drop"))
@@ -0,0 +1,148 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+# --- Schema relevance index ---
+# On wide databases, listing every table in the AI prompt makes the prompt
+# (and the LLM call) grow with the schema. This ranks tables against the
+# question with BM25 over table and column name tokens, then adds the tables
+# the winners are linked to by foreign keys so joins still have their other
+# side. It is built once per schema fingerprint. When nothing in the question
+# matches any table, the caller should fall back to the full schema.
+
+SCHEMA_PRUNE_MIN_TABLES = int(os.getenv("SCHEMA_PRUNE_MIN_TABLES", "12")) # Smaller schemas are sent whole
+SCHEMA_PRUNE_TOP_K = int(os.getenv("SCHEMA_PRUNE_TOP_K", "6"))
+SCHEMA_PRUNE_MAX_TABLES = int(os.getenv("SCHEMA_PRUNE_MAX_TABLES", "15")) # Including FK neighbours
+SCHEMA_PRUNE_MIN_SCORE = float(os.getenv("SCHEMA_PRUNE_MIN_SCORE", "1.0"))
+SCHEMA_INDEX_CACHE_SIZE = 32
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+_TABLE_NAME_WEIGHT = 3 # A match on the table name counts this many column matches
+
+_CAMEL_RE = re.compile(r"([a-z0-9])([A-Z])")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are all any as at be by count does each every find for from get give have how i in is it list "
+    "many me more most my no not of on or per show than that the their there these this those to was what "
+    "when where which who whose with".split()
+)
+
+_indexes = OrderedDict() # fingerprint -> SchemaIndex
+_lock = threading.Lock()
+
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str):
+    """Lowercased word tokens, with snake_case and camelCase split and plurals folded.
+
+    Bare numbers are dropped: "older than 30" must not pick the metrics_30 table.
+    """
+    text = _CAMEL_RE.sub(r"\1 \2", text).lower()
+    return [_stem(t) for t in _TOKEN_RE.findall(text) if t not in _STOPWORDS and not t.isdigit()]
+
+
+class SchemaIndex:
+    def __init__(self, schema, foreign_keys):
+        """schema is {table: [column names]}; foreign_keys is {table: [referenced tables]}."""
+        self.tables = list(schema)
+        self._docs = {}
+        for table, columns in schema.items():
+            tokens = tokenize(table) * _TABLE_NAME_WEIGHT
+            for column in columns:
+                tokens += tokenize(column)
+            self._docs[table] = Counter(tokens)
+        self._lengths = {table: sum(doc.values()) for table, doc in self._docs.items()}
+        self._avg_length = (sum(self._lengths.values()) / len(self._lengths)) if self._lengths else 0.0
+        doc_freq = Counter()
+        for doc in self._docs.values():
+            doc_freq.update(doc.keys())
+        n = len(self._docs)
+        self._idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+
+        # Foreign keys are followed in both directions.
+        self._neighbours = {table: set() for table in schema}
+        for table, referenced in foreign_keys.items():
+            for other in referenced:
+                if table in self._neighbours and other in self._neighbours:
+                    self._neighbours[table].add(other)
+                    self._neighbours[other].add(table)
+
+    def score(self, question: str):
+        """[(table, BM25 score)] for tables sharing at least one term with the question, best first."""
+        terms = [t for t in set(tokenize(question)) if t in self._idf]
+        scores = []
+        for table, doc in self._docs.items():
+            norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * self._lengths[table] / (self._avg_length or 1))
+            total = 0.0
+            for term in terms:
+                tf = doc.get(term)
+                if tf:
+                    total += self._idf[term] * tf * (_BM25_K1 + 1) / (tf + norm)
+            if total > 0:
+                scores.append((table, total))
+        scores.sort(key=lambda item: -item[1])
+        return scores
+
+    def select(self, questions, top_k: int = None, max_tables: int = None):
+        """Tables to show the model for these questions, or None when confidence is too low.
+
+        Confidence is low when any question's best match scores below
+        SCHEMA_PRUNE_MIN_SCORE, since the model may need tables we couldn't
+        identify.
+        """
+        top_k = top_k or SCHEMA_PRUNE_TOP_K
+        max_tables = max_tables or SCHEMA_PRUNE_MAX_TABLES
+        chosen = []
+        for question in questions:
+            scores = self.score(question)
+            if not scores or scores[0][1] < SCHEMA_PRUNE_MIN_SCORE:
+                return None
+            for table, _ in scores[:top_k]:
+                if table not in chosen:
+                    chosen.append(table)
+        if len(chosen) > max_tables:
+            # Questions spread over too much of the schema to prune safely.
+            return None
+
+        for table in list(chosen):
+            for other in sorted(self._neighbours[table]):
+                if len(chosen) >= max_tables:
+                    break
+                if other not in chosen:
+                    chosen.append(other)
+        # Keep the schema's own table order so prompts are stable.
+        chosen = set(chosen)
+        return [table for table in self.tables if table in chosen]
+
+
+def get_index(fingerprint: str, schema, foreign_keys) -> SchemaIndex:
+    with _lock:
+        index = _indexes.get(fingerprint)
+        if index is not None:
+            _indexes.move_to_end(fingerprint)
+            return index
+    index = SchemaIndex(schema, foreign_keys)
+    with _lock:
+        _indexes[fingerprint] = index
+        while len(_indexes) > SCHEMA_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def prune(fingerprint: str, schema, foreign_keys, questions):
+    """The subset of schema ({table: columns}) relevant to questions, or None to use all of it."""
+    if len(schema) < SCHEMA_PRUNE_MIN_TABLES:
+        return None
+    tables = get_index(fingerprint, schema, foreign_keys).select(questions)
+    if not tables:
+        return None
+    return {table: schema[table] for table in tables}
@@ -0,0 +1,275 @@
+import contextvars
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+# --- Request telemetry ---
+# timer(stage) measures one pipeline stage (manual parse, schema fetch, LLM
+# call, SQL execute, ...). Every measurement goes into a process-wide
+# histogram, and into the current request's timings, which TimingMiddleware
+# sends back as a Server-Timing header. count() bumps a named counter. Both
+# are served by /metrics (routes/metrics.py).
+#
+# With PROFILE_SLOW_MS set, a background thread samples every thread's stack
+# each PROFILE_INTERVAL_MS, and requests slower than PROFILE_SLOW_MS are
+# handed, with the stacks sampled while they ran, to the slow-request hook
+# (by default: log the top stacks, and write them to PROFILE_DIR if set).
+
+HISTOGRAM_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0")) # 0 turns the profiler off
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_TOP_STACKS = 10
+PROFILE_MAX_SAMPLES = 200000
+
+log = logging.getLogger(__name__)
+
+_request_timings = contextvars.ContextVar("request_timings", default=None) # stage -> ms for this request
+_lock = threading.Lock()
+_histograms = {} # name -> Histogram
+_counters = Counter()
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1) # Last one is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms: float):
+        i = 0
+        while i < len(HISTOGRAM_BUCKETS_MS) and ms > HISTOGRAM_BUCKETS_MS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def snapshot(self):
+        cumulative, buckets = 0, {}
+        for bound, n in zip(HISTOGRAM_BUCKETS_MS + ("+Inf",), self.buckets):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        return {"count": self.count, "sum_ms": round(self.sum_ms, 3), "buckets": buckets}
+
+
+def observe(name: str, ms: float):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(ms)
+
+
+def count(name: str, n: int = 1):
+    with _lock:
+        _counters[name] += n
+
+
+@contextmanager
+def timer(stage: str):
+    """Times the block as `stage`, for the metrics and the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        observe("stage_" + stage, ms)
+        timings = _request_timings.get()
+        if timings is not None:
+            # Stage workers share the request's dict (see stages.run_stage); one
+            # abandoned after a timeout may still write while the middleware reads.
+            with _lock:
+                timings[stage] = timings.get(stage, 0.0) + ms
+
+
+def json_response(payload):
+    """Serializes an endpoint's result as FastAPI would, timed as the "serialize" stage."""
+    if isinstance(payload, Response):
+        return payload
+    with timer("serialize"):
+        return JSONResponse(jsonable_encoder(payload))
+
+
+def timed_json(endpoint):
+    """Decorator for async endpoints that return plain data; see json_response."""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        return json_response(await endpoint(*args, **kwargs))
+    return wrapper
+
+
+def snapshot():
+    """Counters and histograms as plain data."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {name: h.snapshot() for name, h in sorted(_histograms.items())},
+        }
+
+
+def prometheus_text(extra_counters=None) -> str:
+    """The metrics in Prometheus text exposition format."""
+    data = snapshot()
+    counters = dict(data["counters"], **(extra_counters or {}))
+    lines = []
+    for name, value in sorted(counters.items()):
+        lines.append(f"# TYPE nl2sql_{name} counter")
+        lines.append(f"nl2sql_{name} {value}")
+    for name, h in data["histograms"].items():
+        lines.append(f"# TYPE nl2sql_{name}_ms histogram")
+        for bound, n in h["buckets"].items():
+            lines.append(f'nl2sql_{name}_ms_bucket{{le="{bound}"}} {n}')
+        lines.append(f"nl2sql_{name}_ms_sum {h['sum_ms']}")
+        lines.append(f"nl2sql_{name}_ms_count {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Sampling profiler ---
+
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py") # Leaf frames of idle threads
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="telemetry-sampler", daemon=True)
+        self.interval = interval
+        self.samples = deque(maxlen=PROFILE_MAX_SAMPLES) # (monotonic time, collapsed stack)
+        self._samples_lock = threading.Lock()
+
+    def run(self):
+        while True:
+            now = time.monotonic()
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            with self._samples_lock:
+                self.samples.extend((now, stack) for stack in stacks)
+            time.sleep(self.interval)
+
+    def stacks_between(self, start: float, end: float) -> Counter:
+        with self._samples_lock:
+            return Counter(stack for t, stack in self.samples if start <= t <= end)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def _get_sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = _Sampler(PROFILE_INTERVAL_MS / 1000)
+            _sampler.start()
+        return _sampler
+
+
+def log_slow_request(report):
+    """Default slow-request hook: logs the most sampled stacks (and saves all of them to PROFILE_DIR)."""
+    stacks = report["stacks"]
+    top = "\n".join(f"  {n:5d} {stack}" for stack, n in stacks.most_common(PROFILE_TOP_STACKS))
+    log.warning(
+        "Slow request %s %s: %.1f ms %s; %d samples, top stacks:\n%s",
+        report["method"], report["path"], report["total_ms"], report["timings"], sum(stacks.values()), top,
+    )
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"slow-{time.strftime('%Y%m%d-%H%M%S')}-{report['path'].strip('/').replace('/', '_') or 'root'}.folded"
+        with open(os.path.join(PROFILE_DIR, name), "w") as f:
+            f.writelines(f"{stack} {n}\n" for stack, n in stacks.items()) # Flame graph input
+
+
+_slow_request_hook = log_slow_request
+
+
+def set_slow_request_hook(hook):
+    """hook(report) is called for each request slower than PROFILE_SLOW_MS.
+
+    report has method, path, status, total_ms, timings ({stage: ms}) and
+    stacks (Counter of collapsed stacks sampled while the request ran).
+    """
+    global _slow_request_hook
+    _slow_request_hook = hook
+
+
+# --- Middleware ---
+
+def _copy_timings(timings):
+    with _lock:
+        return dict(timings)
+
+
+def _server_timing(timings, total_ms: float) -> bytes:
+    parts = [f"{stage};dur={ms:.3f}" for stage, ms in _copy_timings(timings).items()]
+    parts.append(f"total;dur={total_ms:.3f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class TimingMiddleware:
+    """Collects stage timings per request, adds the Server-Timing header and records request metrics.
+
+    Headers go out when the response starts, so for a streamed response the
+    header covers only the work done before the first chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        context_token = _request_timings.set(timings)
+        start = time.perf_counter()
+        profile_start = time.monotonic()
+        if PROFILE_SLOW_MS > 0:
+            _get_sampler()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total_ms = (time.perf_counter() - start) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(timings, total_ms)))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            _request_timings.reset(context_token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope["path"]
+            observe("request", total_ms)
+            count("requests")
+            if status >= 500:
+                count("errors_http_5xx")
+            if PROFILE_SLOW_MS > 0 and total_ms >= PROFILE_SLOW_MS:
+                report = {
+                    "method": scope["method"], "path": path, "status": status, "total_ms": total_ms,
+                    "timings": {stage: round(ms, 3) for stage, ms in _copy_timings(timings).items()},
+                    "stacks": _get_sampler().stacks_between(profile_start, time.monotonic()),
+                }
+                try:
+                    _slow_request_hook(report)
+                except Exception:
+                    log.exception("Slow request hook failed")
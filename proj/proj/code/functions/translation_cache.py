@@ -0,0 +1,131 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- NL-to-SQL translation cache ---
+# Sits in front of the AI fallback. Entries are keyed on the normalized
+# question plus the schema fingerprint (schema_cache.get_fingerprint), so the
+# same question against the same schema hits even across sessions. A small
+# in-memory LRU is backed by a SQLite file that survives restarts. Both tiers
+# expire entries after TRANSLATION_CACHE_TTL seconds, and the disk tier drops
+# its least recently used entries beyond TRANSLATION_CACHE_DISK_MAX.
+
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "2048"))
+TRANSLATION_CACHE_DISK_MAX = int(os.getenv("TRANSLATION_CACHE_DISK_MAX", "100000"))
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", str(7 * 24 * 3600)))
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", "translation_cache.db")
+_PRUNE_EVERY = 256 # Disk writes between size-based prunes
+
+_QUOTED_RE = re.compile(r"""('[^']*'|"[^"]*")""")
+_PUNCT_RE = re.compile(r"!(?!=)|[^\w\s%<>=!*.-]") # Keeps comparison operators and decimals
+_SPACE_RE = re.compile(r"\s+")
+
+log = logging.getLogger(__name__)
+_memory = OrderedDict() # key -> (sql, stored_at)
+_lock = threading.Lock()
+_disk = None
+_writes_since_prune = 0
+stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases and collapses whitespace/punctuation, leaving quoted literals alone.
+
+    Quoted values are kept verbatim because they end up as SQL literals,
+    where case matters.
+    """
+    parts = _QUOTED_RE.split(question)
+    for i in range(0, len(parts), 2): # Even indexes are outside quotes
+        parts[i] = _PUNCT_RE.sub(" ", parts[i].lower())
+    return _SPACE_RE.sub(" ", "".join(parts)).strip(" .")
+
+
+def _key(question: str, fingerprint: str) -> str:
+    return fingerprint + ":" + normalize_question(question)
+
+
+def _get_disk():
+    """Opens the disk tier on first use. Caller holds _lock."""
+    global _disk
+    if _disk is None:
+        _disk = sqlite3.connect(TRANSLATION_CACHE_PATH, check_same_thread=False)
+        _disk.execute("PRAGMA journal_mode=WAL;")
+        _disk.execute("PRAGMA synchronous=NORMAL;")
+        _disk.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, sql TEXT NOT NULL, stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        _disk.execute("CREATE INDEX IF NOT EXISTS translations_used_at ON translations(used_at)")
+        _disk.commit()
+    return _disk
+
+
+def _remember(key: str, sql: str, stored_at: float):
+    """Puts an entry in the memory tier. Caller holds _lock."""
+    _memory[key] = (sql, stored_at)
+    _memory.move_to_end(key)
+    while len(_memory) > TRANSLATION_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def get(question: str, fingerprint: str):
+    """Cached SQL for the question against this schema, or None."""
+    key = _key(question, fingerprint)
+    now = time.time()
+    with _lock:
+        entry = _memory.get(key)
+        if entry and now - entry[1] <= TRANSLATION_CACHE_TTL:
+            _memory.move_to_end(key)
+            stats["memory_hits"] += 1
+            return entry[0]
+        if entry:
+            del _memory[key]
+
+        try:
+            disk = _get_disk()
+            row = disk.execute("SELECT sql, stored_at FROM translations WHERE key = ?;", (key,)).fetchone()
+            if row and now - row[1] <= TRANSLATION_CACHE_TTL:
+                disk.execute("UPDATE translations SET used_at = ? WHERE key = ?;", (now, key))
+                disk.commit()
+                _remember(key, row[0], row[1])
+                stats["disk_hits"] += 1
+                return row[0]
+            if row:
+                disk.execute("DELETE FROM translations WHERE key = ?;", (key,))
+                disk.commit()
+        except sqlite3.Error as e:
+            log.error("Translation cache read error: %s", e)
+
+        stats["misses"] += 1
+        return None
+
+
+def put(question: str, fingerprint: str, sql: str):
+    global _writes_since_prune
+    key = _key(question, fingerprint)
+    now = time.time()
+    with _lock:
+        _remember(key, sql, now)
+        stats["stores"] += 1
+        try:
+            disk = _get_disk()
+            disk.execute(
+                "INSERT OR REPLACE INTO translations (key, sql, stored_at, used_at) VALUES (?, ?, ?, ?);",
+                (key, sql, now, now),
+            )
+            _writes_since_prune += 1
+            if _writes_since_prune >= _PRUNE_EVERY:
+                _writes_since_prune = 0
+                disk.execute("DELETE FROM translations WHERE stored_at < ?;", (now - TRANSLATION_CACHE_TTL,))
+                disk.execute(
+                    "DELETE FROM translations WHERE key IN ("
+                    "SELECT key FROM translations ORDER BY used_at DESC LIMIT -1 OFFSET ?);",
+                    (TRANSLATION_CACHE_DISK_MAX,),
+                )
+            disk.commit()
+        except sqlite3.Error as e:
+            log.error("Translation cache write error: %s", e)
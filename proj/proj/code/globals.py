@@ -1 +1,4 @@
-session_map = {}
\ No newline at end of file
+from routes.session_store import create_store
+
+# Session token -> session record, shared by every worker process (see routes/session_store.py)
+session_store = create_store()
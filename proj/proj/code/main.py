@@ -1,10 +1,25 @@
+import logging
+import os
 from fastapi import FastAPI
+from functions import telemetry
 from routes import process
 from routes import uploaddb
+from routes import browse
+from routes import metrics
+from routes import advisor
 from fastapi.middleware.cors import CORSMiddleware
 
+# LOG_LEVEL=DEBUG also logs every statement that is executed.
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
 uploadrouter = uploaddb.router
 getrouter = process.router
+browserouter = browse.router
+metricsrouter = metrics.router
+advisorrouter = advisor.router
 app = FastAPI()
 
 origins = ["*"]
@@ -14,7 +29,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(telemetry.TimingMiddleware)
 
 app.include_router(uploadrouter)
-app.include_router(getrouter)
\ No newline at end of file
+app.include_router(getrouter)
+app.include_router(browserouter)
+app.include_router(metricsrouter)
+app.include_router(advisorrouter)
@@ -0,0 +1,67 @@
+import logging
+import sqlite3
+from fastapi import APIRouter
+from functions import query_guard
+from functions import telemetry
+from routes import db_pool
+from routes import db_store
+from routes import stages
+
+router = APIRouter()
+
+log = logging.getLogger(__name__)
+
+# --- Index Advisor Endpoints ---
+# The query guard (functions/query_guard) records the full scans each database
+# sees. GET /advisor/indexes lists CREATE INDEX statements for the scans that
+# recur at least min_scans times; POST creates those indexes in the session's
+# own copy of its database (the shared upload is never changed).
+
+
+def _advice(db_path: str, min_scans: int):
+    with db_pool.connection(db_path, readonly=True) as conn:
+        return query_guard.index_advice(conn, db_path, min_scans)
+
+
+def _create_indexes(db_path: str, statements):
+    with db_pool.connection(db_path) as conn:
+        for sql in statements:
+            conn.execute(sql)
+        conn.commit()
+
+
+@router.get('/advisor/indexes')
+@telemetry.timed_json
+async def index_advice(session_token: str, min_scans: int = 1):
+    db_path = await db_store.resolve_session(session_token)
+    if db_path is None:
+        return {"error": "Invalid session. Please re-upload the database."}
+    try:
+        advice = await stages.run_stage(stages.db_executor, stages.DB_TIMEOUT, None, _advice, db_path, min_scans)
+    except Exception as e:
+        return {"error": str(e)}
+    return {"suggestions": advice}
+
+
+@router.post('/advisor/indexes')
+@telemetry.timed_json
+async def create_indexes(session_token: str, min_scans: int = 3):
+    db_path = await db_store.resolve_session(session_token)
+    if db_path is None:
+        return {"error": "Invalid session. Please re-upload the database."}
+    try:
+        advice = await stages.run_stage(stages.db_executor, stages.DB_TIMEOUT, None, _advice, db_path, min_scans)
+        if not advice:
+            return {"created": []}
+        writable = await stages.run_stage(
+            stages.io_executor, stages.IO_TIMEOUT, None, db_store.writable_path, session_token
+        )
+        if writable is None:
+            return {"error": "Session expired. Please re-upload the database."}
+        statements = [item["sql"] for item in advice]
+        # Building an index reads the whole table, so it gets the I/O timeout.
+        await stages.run_stage(stages.db_executor, stages.IO_TIMEOUT, None, _create_indexes, writable, statements)
+    except (stages.StageTimeout, sqlite3.Error) as e:
+        return {"error": f"Creating indexes failed: {e}"}
+    log.info("Created %d indexes for session %s", len(statements), session_token)
+    return {"created": statements}
@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from functions import db_browser
+from functions import response_format
+from functions import telemetry
+from routes import db_pool
+from routes import db_store
+from routes import stages
+from typing import Optional
+
+router = APIRouter()
+
+# --- DB Browser Endpoints ---
+# Schema and row counts come from /browse/schema; table contents are read in
+# keyset-paginated pages from /browse/rows or streamed as NDJSON from
+# /browse/stream. Pass a page's next_after back as `after` to continue.
+# /browse/rows takes a response `format` (see functions/response_format).
+
+
+@router.get('/browse/schema')
+@telemetry.timed_json
+async def browse_schema(session_token: str):
+    db_path = await db_store.resolve_session(session_token)
+    if db_path is None:
+        return {"error": "Invalid session. Please re-upload the database."}
+
+    def load():
+        with db_pool.connection(db_path, readonly=True) as conn:
+            return db_browser.get_schema_with_counts(db_path, conn)
+
+    try:
+        return {"tables": await stages.run_stage(stages.db_executor, stages.DB_TIMEOUT, None, load)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@router.get('/browse/rows')
+@response_format.negotiated
+async def browse_rows(request: Request, session_token: str, table: str, after: Optional[int] = None, limit: int = 0,
+                      format: Optional[str] = None):
+    db_path = await db_store.resolve_session(session_token)
+    if db_path is None:
+        return {"error": "Invalid session. Please re-upload the database."}
+
+    def load():
+        with db_pool.connection(db_path, readonly=True) as conn:
+            return db_browser.fetch_page(db_path, table, conn, after, limit)
+
+    try:
+        page = await stages.run_stage(stages.db_executor, stages.DB_TIMEOUT, None, load)
+        return {"table": table, **page}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@router.get('/browse/stream')
+async def browse_stream(session_token: str, table: str, after: Optional[int] = None):
+    db_path = await db_store.resolve_session(session_token)
+    if db_path is None:
+        return {"error": "Invalid session. Please re-upload the database."}
+
+    def open_stream():
+        # The table is checked and the statement started here, so errors are
+        # still reported as JSON rather than cutting off a 200 response.
+        conn = db_pool.checkout(db_path, readonly=True)
+        try:
+            return conn, db_browser.open_table(db_path, table, conn, after)
+        except Exception:
+            db_pool.release(conn)
+            raise
+
+    try:
+        conn, cursor = await stages.run_stage(stages.db_executor, stages.DB_TIMEOUT, None, open_stream)
+    except Exception as e:
+        return {"error": str(e)}
+    body = db_pool.StreamBody(db_browser.iter_table_ndjson(table, cursor), conn, cursor)
+    return StreamingResponse(body, media_type="application/x-ndjson", background=BackgroundTask(body.close))
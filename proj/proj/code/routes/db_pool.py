@@ -0,0 +1,230 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+# --- SQLite connection pool ---
+# Connections are kept per database file and per mode (read-write or
+# read-only) and reused across requests instead of being opened for every
+# query. Each one is configured once for read speed when it is created.
+# Idle connections are closed after POOL_IDLE_TIMEOUT seconds, and no more
+# than POOL_MAX_CONNECTIONS exist in total; at the cap the oldest idle
+# connection (from any session) is closed to make room, and if none are idle
+# callers wait up to POOL_ACQUIRE_TIMEOUT seconds.
+
+POOL_MAX_CONNECTIONS = int(os.getenv("POOL_MAX_CONNECTIONS", "64"))
+POOL_IDLE_TIMEOUT = float(os.getenv("POOL_IDLE_TIMEOUT", "300"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("POOL_ACQUIRE_TIMEOUT", "30"))
+POOL_MMAP_SIZE = int(os.getenv("POOL_MMAP_SIZE", str(256 * 1024 * 1024)))
+POOL_CACHE_KIB = int(os.getenv("POOL_CACHE_KIB", "65536")) # Page cache per connection
+DB_BUSY_TIMEOUT = 30 # Seconds a connection waits on a locked database
+
+_idle = defaultdict(deque) # (db_path, readonly) -> deque of (conn, released_at)
+_in_use = {} # id(conn) -> ((db_path, readonly), generation)
+_generation = defaultdict(int) # db_path -> bumped by close_db so stale conns aren't pooled
+_total = 0
+_wal_checked = set() # db_paths whose journal mode has been set
+_immutable = set() # db_paths whose files never change (see mark_immutable)
+_cond = threading.Condition()
+
+
+class PoolExhaustedError(sqlite3.OperationalError):
+    pass
+
+
+def _open(db_path: str, readonly: bool) -> sqlite3.Connection:
+    # Pooled connections move between worker threads (one user at a time).
+    if db_path in _immutable:
+        uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+    try:
+        conn.execute(f"PRAGMA mmap_size={POOL_MMAP_SIZE};")
+        conn.execute(f"PRAGMA cache_size=-{POOL_CACHE_KIB};")
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        if db_path not in _wal_checked and db_path not in _immutable:
+            # WAL lets readers run alongside a writer; it needs a writable file.
+            if os.access(db_path, os.W_OK) and os.access(os.path.dirname(os.path.abspath(db_path)), os.W_OK):
+                conn.execute("PRAGMA journal_mode=WAL;")
+            _wal_checked.add(db_path)
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON;")
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def _evict_expired(now: float):
+    """Closes connections idle longer than POOL_IDLE_TIMEOUT. Caller holds _cond."""
+    global _total
+    for key in list(_idle):
+        idle = _idle[key]
+        while idle and now - idle[0][1] > POOL_IDLE_TIMEOUT:
+            conn, _ = idle.popleft()
+            conn.close()
+            _total -= 1
+        if not idle:
+            del _idle[key]
+
+
+def _evict_oldest_idle() -> bool:
+    """Closes the least recently used idle connection. Caller holds _cond."""
+    global _total
+    oldest_key = None
+    for key, idle in _idle.items():
+        if idle and (oldest_key is None or idle[0][1] < _idle[oldest_key][0][1]):
+            oldest_key = key
+    if oldest_key is None:
+        return False
+    conn, _ = _idle[oldest_key].popleft()
+    if not _idle[oldest_key]:
+        del _idle[oldest_key]
+    conn.close()
+    _total -= 1
+    return True
+
+
+def checkout(db_path: str, readonly: bool = False) -> sqlite3.Connection:
+    """Takes a connection out of the pool. Every checkout must be paired with release()."""
+    global _total
+    key = (db_path, readonly)
+    deadline = time.monotonic() + POOL_ACQUIRE_TIMEOUT
+    with _cond:
+        while True:
+            _evict_expired(time.monotonic())
+            idle = _idle.get(key)
+            if idle:
+                # Most recently used first: its pages are the warmest.
+                conn, _ = idle.pop()
+                if not idle:
+                    del _idle[key]
+                _in_use[id(conn)] = (key, _generation[db_path])
+                return conn
+            if _total < POOL_MAX_CONNECTIONS or _evict_oldest_idle():
+                _total += 1
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolExhaustedError("Too many open database connections; try again shortly.")
+            _cond.wait(remaining)
+
+    try:
+        conn = _open(db_path, readonly)
+    except Exception:
+        with _cond:
+            _total -= 1
+            _cond.notify()
+        raise
+    with _cond:
+        _in_use[id(conn)] = (key, _generation[db_path])
+    return conn
+
+
+def release(conn: sqlite3.Connection):
+    """Returns a connection to the pool, rolling back anything left uncommitted."""
+    global _total
+    with _cond:
+        key, generation = _in_use.pop(id(conn), (None, None))
+    if key is None:
+        return
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        conn.close()
+        with _cond:
+            _total -= 1
+            _cond.notify()
+        return
+    with _cond:
+        if generation != _generation[key[0]]:
+            conn.close()
+            _total -= 1
+        else:
+            _idle[key].append((conn, time.monotonic()))
+        _cond.notify()
+
+
+@contextmanager
+def connection(db_path: str, readonly: bool = False):
+    conn = checkout(db_path, readonly)
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+class StreamBody:
+    """Body iterator for a StreamingResponse that reads from a checked-out connection.
+
+    close() closes the cursor and releases the connection. It runs when the
+    body is exhausted, from the response's background task, and at the
+    latest when the body is garbage collected: Starlette neither closes a body
+    it never started (the client left first) nor runs the background task
+    after a disconnect.
+    """
+
+    def __init__(self, iterator, conn: sqlite3.Connection, cursor: sqlite3.Cursor = None):
+        self._iterator = iterator
+        self._conn = conn
+        self._cursor = cursor
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+            if self._cursor is not None:
+                self._cursor.close()
+        finally:
+            release(self._conn)
+
+    def __del__(self):
+        self.close()
+
+
+def close_db(db_path: str):
+    """Closes every idle connection to db_path, e.g. before its file is removed.
+
+    Connections still in use are closed as they are released.
+    """
+    global _total
+    with _cond:
+        for readonly in (False, True):
+            for conn, _ in _idle.pop((db_path, readonly), ()):
+                conn.close()
+                _total -= 1
+        _wal_checked.discard(db_path)
+        _generation[db_path] += 1
+        _cond.notify_all()
+
+
+def mark_immutable(db_path: str):
+    """Opens db_path read-only without file locking from now on.
+
+    Only for files that are never written again, such as shared upload blobs.
+    """
+    if db_path in _immutable:
+        return
+    with _cond:
+        _immutable.add(db_path)
@@ -0,0 +1,326 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from globals import session_store
+from functions import db_browser
+from functions import query_guard
+from functions import result_cache
+from functions import schema_cache
+from routes import db_pool
+from routes import stages
+
+# --- Uploaded database store ---
+# Uploads are stored by content: the file is hashed while it is written, and
+# every session that uploads the same bytes shares one read-only blob in
+# blobs/<sha256>.db. A session only gets its own copy (sessions/<token>.db)
+# the first time it runs a statement that writes (copy-on-write).
+# Sessions expire SESSION_TTL seconds after their last use. When the store
+# grows past DB_STORE_QUOTA bytes, blobs no session uses are removed first,
+# then the least recently used sessions.
+# Sessions live in session_store (shared by worker processes); blobs are
+# plain files, so every worker sees the same ones. A blob's mtime is its
+# last use.
+
+log = logging.getLogger(__name__)
+
+STORE_FOLDER = os.getenv("DB_STORE_FOLDER", "temp_db_files")
+BLOB_FOLDER = os.path.join(STORE_FOLDER, "blobs")
+SESSION_FOLDER = os.path.join(STORE_FOLDER, "sessions")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_TOUCH_INTERVAL = float(os.getenv("SESSION_TOUCH_INTERVAL", "60")) # Last-use updates are written this often at most
+DB_STORE_QUOTA = int(os.getenv("DB_STORE_QUOTA", str(20 * 1024 ** 3))) # Bytes, blobs plus private copies
+SQLITE_HEADER = b"SQLite format 3\x00"
+SQLITE_HEADER_SIZE = 100
+_SHA256_RE = re.compile(r"[0-9a-f]{64}")
+
+_copy_locks = {} # token -> Lock held while this process makes that session's private copy
+_copy_locks_lock = threading.Lock()
+
+os.makedirs(BLOB_FOLDER, exist_ok=True)
+os.makedirs(SESSION_FOLDER, exist_ok=True)
+
+
+class InvalidDatabaseError(ValueError):
+    pass
+
+
+class QuotaExceededError(ValueError):
+    pass
+
+
+def is_sha256(value: str) -> bool:
+    return isinstance(value, str) and _SHA256_RE.fullmatch(value) is not None
+
+
+def blob_path(sha256: str) -> str:
+    # sha256 may come from a client: anything but a digest could name a file outside the store.
+    if not is_sha256(sha256):
+        raise ValueError(f"Not a sha256 digest: {sha256!r}")
+    return os.path.join(BLOB_FOLDER, f"{sha256}.db")
+
+
+def private_path(token: str) -> str:
+    return os.path.join(SESSION_FOLDER, f"{token}.db")
+
+
+def _session_db_path(token: str, session) -> str:
+    return private_path(token) if session["private"] else blob_path(session["blob"])
+
+
+def _blobs():
+    """{sha256: (size, last_used)} for every stored blob."""
+    blobs = {}
+    for name in os.listdir(BLOB_FOLDER):
+        sha256, ext = os.path.splitext(name)
+        if ext == ".db" and is_sha256(sha256):
+            try:
+                stat = os.stat(os.path.join(BLOB_FOLDER, name))
+            except FileNotFoundError:
+                continue
+            blobs[sha256] = (stat.st_size, stat.st_mtime)
+    return blobs
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log.error("Error removing %s: %s", path, e)
+
+
+def _remove_orphans():
+    """Deletes old private copies whose session is gone, e.g. after a crash."""
+    now = time.time()
+    with session_store.lock():
+        for name in os.listdir(SESSION_FOLDER):
+            path = os.path.join(SESSION_FOLDER, name)
+            try:
+                old = now - os.path.getmtime(path) > SESSION_TTL
+            except FileNotFoundError:
+                continue
+            if old and session_store.get(name.split(".db")[0]) is None:
+                _remove_file(path)
+
+
+def check_header(header: bytes, size: int = None):
+    """Raises InvalidDatabaseError unless header/size look like a SQLite database file.
+
+    Without size, only the header itself is checked (the file is still arriving).
+    """
+    if len(header) < SQLITE_HEADER_SIZE or not header.startswith(SQLITE_HEADER):
+        raise InvalidDatabaseError("File is not a SQLite database.")
+    page_size = int.from_bytes(header[16:18], "big")
+    if page_size == 1:
+        page_size = 65536
+    if page_size < 512 or page_size & (page_size - 1):
+        raise InvalidDatabaseError("SQLite header has an invalid page size.")
+    if header[18] not in (1, 2) or header[19] not in (1, 2):
+        raise InvalidDatabaseError("SQLite header has an unsupported file format version.")
+    if size is not None and size % page_size:
+        raise InvalidDatabaseError("Database file is truncated.")
+
+
+class Upload:
+    """Writes an upload to a temporary file, hashing and checking it as it goes.
+
+    Called from the I/O executor: write() per chunk, then finish() to move it
+    into the store (or abort() to throw it away).
+    """
+
+    def __init__(self):
+        self.temp_path = os.path.join(STORE_FOLDER, f".upload-{uuid.uuid4()}")
+        self._file = open(self.temp_path, "wb")
+        self._hash = hashlib.sha256()
+        self._header = b""
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > DB_STORE_QUOTA:
+            raise QuotaExceededError("Database is larger than the upload store.")
+        if len(self._header) < SQLITE_HEADER_SIZE:
+            self._header += chunk[:SQLITE_HEADER_SIZE - len(self._header)]
+            if len(self._header) >= len(SQLITE_HEADER) and not self._header.startswith(SQLITE_HEADER):
+                raise InvalidDatabaseError("File is not a SQLite database.")
+            if len(self._header) == SQLITE_HEADER_SIZE:
+                check_header(self._header)
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def abort(self):
+        self._file.close()
+        _remove_file(self.temp_path)
+
+    def finish(self) -> str:
+        """Checks the file and adds it to the store. Returns its sha256."""
+        self._file.close()
+        try:
+            check_header(self._header, self.size)
+        except InvalidDatabaseError:
+            _remove_file(self.temp_path)
+            raise
+        sha256 = self._hash.hexdigest()
+        path = blob_path(sha256)
+        with session_store.lock():
+            if os.path.exists(path):
+                _remove_file(self.temp_path) # Same bytes are already stored
+                os.utime(path)
+            else:
+                os.chmod(self.temp_path, 0o444)
+                os.replace(self.temp_path, path)
+        return sha256
+
+
+def open_session(sha256: str):
+    """New session token for a stored blob, or None if the blob isn't stored (or sha256 isn't a digest)."""
+    if not is_sha256(sha256):
+        return None
+    token = str(uuid.uuid4())
+    path = blob_path(sha256)
+    with session_store.lock():
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        session_store.put(token, {"blob": sha256, "private": False, "last_used": time.time()})
+    sweep(keep=token)
+    return token
+
+
+def session_path(token: str):
+    """Database path for a live session (marking it used), or None."""
+    session = session_store.get(token)
+    if session is None:
+        return None
+    now = time.time()
+    if now - session["last_used"] > SESSION_TTL:
+        with session_store.lock():
+            _drop_session(token)
+        return None
+    path = _session_db_path(token, session)
+    if now - session["last_used"] > SESSION_TOUCH_INTERVAL:
+        session_store.update(token, last_used=now)
+        if not session["private"]:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+    if not session["private"]:
+        db_pool.mark_immutable(path)
+    return path
+
+
+async def resolve_session(token: str):
+    """session_path for async handlers. It runs on the I/O executor: it may
+    query and update the session store, and drop an expired session's files."""
+    return await stages.run_stage(stages.io_executor, stages.IO_TIMEOUT, None, session_path, token)
+
+
+def writable_path(token: str):
+    """Path of the session's own copy of its database, made on first call. None if the session is gone."""
+    with _copy_locks_lock:
+        copy_lock = _copy_locks.setdefault(token, threading.Lock())
+    with copy_lock:
+        session = session_store.get(token)
+        if session is None:
+            return None
+        path = private_path(token)
+        if session["private"]:
+            return path
+        # Copied without the store lock: it can take a while for a large
+        # database. If another worker makes the copy first, ours is discarded.
+        temp_path = f"{path}.{uuid.uuid4()}.tmp"
+        shutil.copyfile(blob_path(session["blob"]), temp_path)
+        os.chmod(temp_path, 0o644)
+        with session_store.lock():
+            session = session_store.get(token)
+            if session is None or session["private"]:
+                _remove_file(temp_path)
+                return path if session else None
+            os.replace(temp_path, path)
+            session_store.update(token, private=True)
+    sweep(keep=token)
+    return path
+
+
+def _drop_session(token: str):
+    """Forgets a session and deletes its private copy. Caller holds session_store.lock()."""
+    session = session_store.get(token)
+    session_store.delete(token)
+    with _copy_locks_lock:
+        _copy_locks.pop(token, None)
+    if session and session["private"]:
+        path = private_path(token)
+        db_pool.close_db(path)
+        schema_cache.invalidate(path)
+        result_cache.invalidate(path)
+        db_browser.invalidate(path)
+        query_guard.forget(path)
+        for suffix in ("", "-wal", "-shm"):
+            _remove_file(path + suffix)
+
+
+def _drop_blob(sha256: str):
+    """Deletes a blob no session uses. Caller holds session_store.lock()."""
+    path = blob_path(sha256)
+    db_pool.close_db(path)
+    schema_cache.invalidate(path)
+    result_cache.invalidate(path)
+    db_browser.invalidate(path)
+    query_guard.forget(path)
+    _remove_file(path)
+
+
+def _usage(sessions, blobs) -> int:
+    """Bytes on disk for blobs and private copies."""
+    total = sum(size for size, _ in blobs.values())
+    for token, session in sessions:
+        if session["private"]:
+            for suffix in ("", "-wal"):
+                try:
+                    total += os.path.getsize(private_path(token) + suffix)
+                except OSError:
+                    pass
+    return total
+
+
+def sweep(keep: str = None):
+    """Expires idle sessions, then evicts until the store fits in DB_STORE_QUOTA.
+
+    The session `keep` is never evicted for space.
+    """
+    now = time.time()
+    with session_store.lock():
+        sessions = []
+        for token, session in session_store.items():
+            if now - session["last_used"] > SESSION_TTL:
+                _drop_session(token)
+            else:
+                sessions.append((token, session))
+        blobs = _blobs()
+
+        while _usage(sessions, blobs) > DB_STORE_QUOTA:
+            in_use = {s["blob"] for _, s in sessions if not s["private"]}
+            unused = [sha for sha in blobs if sha not in in_use]
+            if unused:
+                sha256 = min(unused, key=lambda sha: blobs[sha][1])
+                log.info("Store over quota; removing unused database %s", sha256)
+                _drop_blob(sha256)
+                del blobs[sha256]
+            else:
+                candidates = [(t, s) for t, s in sessions if t != keep]
+                if not candidates:
+                    break
+                token, _ = min(candidates, key=lambda item: item[1]["last_used"])
+                log.info("Store over quota; ending session %s", token)
+                _drop_session(token)
+                sessions = [(t, s) for t, s in sessions if t != token]
+
+
+_remove_orphans()
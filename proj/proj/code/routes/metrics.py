@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from functions import result_cache
+from functions import telemetry
+from functions import translation_cache
+from routes import process
+
+router = APIRouter()
+
+# --- Metrics Endpoint ---
+# Stage and request latency histograms plus counters (see functions/telemetry),
+# together with the translation cache, result cache and AI dispatcher
+# counters. JSON by default; format=prometheus for the Prometheus text format.
+
+
+def _component_counters():
+    counters = {f"translation_cache_{k}": v for k, v in translation_cache.stats.items()}
+    counters.update({f"result_cache_{k}": v for k, v in result_cache.stats.items()})
+    counters.update({f"ai_dispatch_{k}": v for k, v in process.ai_dispatcher.stats.items()})
+    return counters
+
+
+@router.get('/metrics')
+async def metrics(format: str = "json"):
+    if format == "prometheus":
+        return PlainTextResponse(telemetry.prometheus_text(_component_counters()))
+    data = telemetry.snapshot()
+    data["counters"].update(_component_counters())
+    return data
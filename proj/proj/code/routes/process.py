@@ -1,81 +1,89 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 router = APIRouter()
 from functions import manualFunction # Your existing manual function
-from globals import session_map
+from functions import schema_cache
+from functions import db_browser
+from functions import query_guard
+from functions import query_results
+from functions import response_format
+from functions import result_cache
+from functions import translation_cache
+from functions import ai_models
+from functions import ai_dispatch
+from functions import schema_index
+from functions import telemetry
+from routes import db_pool
+from routes import db_store
+from routes import stages
 import sqlite3
+import asyncio
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from pydantic import BaseModel
 import os                     # To read environment variables
 from dotenv import load_dotenv # To load .env file
-import google.generativeai as genai # Gemini API
 
 # Load environment variables from .env file
 load_dotenv()
 
-# --- AI Function Setup ---
-# Configure Gemini API using the key from .env
-try:
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        print("Warning: GOOGLE_API_KEY not found in .env file. AI function will fail.")
-        # Attempt to configure anyway, but API calls will likely fail later.
-        genai.configure(api_key="MISSING_KEY") # Use a placeholder
-    else:
-        genai.configure(api_key=api_key)
-except Exception as e:
-    print(f"Error configuring Gemini API: {e}")
-    # Handle the case where configuration itself fails catastrophically
-    # You might want to prevent the app from starting or disable AI features
-    # For now, we'll let it proceed, but AI calls will fail.
-    genai.configure(api_key="CONFIGURATION_ERROR")
+log = logging.getLogger(__name__)
 
+# --- AI Function Setup ---
+# The model backend (Gemini, or a local stub) is chosen in functions/ai_models
+# and configured on first use.
 
 # --- Helper to get schema just for AI prompt ---
 def get_db_schema_for_ai(db_path: str):
     """Gets table names and column names for the AI prompt."""
     schema = {}
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        for (table_name,) in tables:
+        with db_pool.connection(db_path, readonly=True) as conn:
+            full_schema = schema_cache.get_schema(db_path, conn)
+        for table_name, columns_data in full_schema.items():
             if table_name.startswith('sqlite_'): continue
-            cursor.execute(f"PRAGMA table_info({table_name});")
-            columns_data = cursor.fetchall()
-            columns = [col[1] for col in columns_data]
-            schema[table_name] = columns
+            schema[table_name] = [col[1] for col in columns_data]
     except Exception as e:
-        print(f"Error getting schema for AI: {e}")
-    finally:
-        if conn:
-            conn.close()
+        log.error("Error getting schema for AI: %s", e)
     return schema
 
-# --- AI Function Definition (AttributeError fix) ---
-def ai_function(nlp_text: str, db_path: str) -> str:
-    """
-    Converts a natural language string into an SQLite3 SQL query using Google's Gemini API,
-    providing database schema as context.
-    """
-    # Check if API key might be missing/invalid from configuration step
-    # Note: This is a basic check; the actual API call is the definitive test.
-    current_key = os.getenv("GOOGLE_API_KEY") # Re-check env var directly if needed
-    if not current_key or current_key in ["MISSING_KEY", "CONFIGURATION_ERROR"]:
-         print("AI Function: API Key seems missing or invalid based on initial setup.")
-         # You could return an error here, or let the API call fail below.
-         # For robustness, let's allow the attempt and catch the specific API error.
-         # return "AI_ERROR: Gemini API key not configured correctly."
 
+def prune_schema_for_ai(db_path: str, schema, questions: List[str]):
+    """Only the tables relevant to questions (see schema_index), or None to send the whole schema."""
+    try:
+        with db_pool.connection(db_path, readonly=True) as conn:
+            fingerprint = schema_cache.get_fingerprint(db_path, conn)
+            foreign_keys = schema_cache.get_foreign_keys(db_path, conn)
+        return schema_index.prune(fingerprint, schema, foreign_keys, questions)
+    except Exception as e:
+        log.error("Error pruning schema for AI: %s", e)
+        return None
+
+# --- AI Prompt Building ---
+def build_schema_prompt_part(db_path: str, questions: List[str]) -> str:
     # Get schema to help the AI
-    schema_details = get_db_schema_for_ai(db_path)
+    with telemetry.timer("schema"):
+        schema_details = get_db_schema_for_ai(db_path)
     schema_prompt_part = "The database has the following tables and columns:\n"
+    with telemetry.timer("prune"):
+        pruned = prune_schema_for_ai(db_path, schema_details, questions) if schema_details else None
+    if pruned:
+        schema_details = pruned
+        schema_prompt_part = "The database tables and columns relevant to this request are:\n"
     if not schema_details:
          schema_prompt_part = "Could not retrieve database schema.\n"
     else:
-        for table, columns in schema_details.items():
-            schema_prompt_part += f"- {table}: ({', '.join(columns)})\n"
+        with telemetry.timer("prompt"):
+            for table, columns in schema_details.items():
+                schema_prompt_part += f"- {table}: ({', '.join(columns)})\n"
+    return schema_prompt_part
+
 
-    prompt = f"""
+def build_prompt(schema_prompt_part: str, nlp_text: str) -> str:
+    return f"""
     You are an expert natural language to SQLite3 SQL translator.
     {schema_prompt_part}
     Convert the following natural language instruction into a single, valid SQLite3 SQL query.
@@ -85,142 +93,515 @@ def ai_function(nlp_text: str, db_path: str) -> str:
     SQL Query:
     """
 
+
+def build_batch_prompt(schema_prompt_part: str, questions: List[str]) -> str:
+    numbered = "\n".join(f'{i}. "{" ".join(q.split())}"' for i, q in enumerate(questions, 1))
+    return f"""
+    You are an expert natural language to SQLite3 SQL translator.
+    {schema_prompt_part}
+    Convert each of the following numbered natural language instructions into a single, valid SQLite3 SQL query.
+    For each instruction write a line "### <number>" followed by its SQL query on the next line.
+    Only provide the SQL queries, nothing else. Do not wrap them in markdown or backticks.
+
+{numbered}
+    """
+
+
+_BATCH_HEADER_RE = re.compile(r"^\s*###\s*(\d+)\s*$", re.MULTILINE)
+
+
+def clean_sql(text: str) -> str:
+    # Basic cleanup
+    sql_query = text.strip()
+    sql_query = sql_query.replace('```sql', '').replace('```', '').strip()
+
+    if not sql_query or len(sql_query) < 5:
+         raise ValueError("Generated query is empty or too short.")
+    if not sql_query.endswith(';'):
+        sql_query += ';'
+    return sql_query
+
+
+def split_batch_answer(text: str, count: int) -> List[str]:
+    """Per-question SQL from a multi-question answer; None where a part is missing or unusable."""
+    answers = [None] * count
+    parts = _BATCH_HEADER_RE.split(text)
+    # parts = [preamble, number, body, number, body, ...]
+    for number, body in zip(parts[1::2], parts[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count and answers[index] is None:
+            try:
+                answers[index] = clean_sql(body)
+            except ValueError:
+                pass
+    return answers
+
+
+def ai_error_message(e: Exception) -> str:
+    # Check if the error message indicates an API key issue
+    if "api key" in str(e).lower():
+         return f"AI_ERROR: Invalid API Key or API not enabled: {e}"
+    return f"AI_ERROR: Error generating query: {e}"
+
+
+# --- AI Function Definition ---
+def ai_translate_many(db_path: str, questions: List[str], cancel: stages.CancelToken = None) -> List[str]:
+    """
+    Converts natural language strings into SQLite3 SQL queries with one model call,
+    providing database schema as context. Returns one SQL string (or "AI_ERROR: ..."
+    message) per question. Blocking; run it on stages.llm_executor.
+
+    With several questions, the ones whose part of the answer can't be used
+    (or all of them, if the call fails) come back as None, for the caller to
+    retry one at a time.
+    """
+    # The request may have timed out or disconnected while queued for a worker.
+    if cancel is not None and cancel.cancelled:
+        return ["AI_ERROR: Request cancelled."] * len(questions)
+
+    schema_prompt_part = build_schema_prompt_part(db_path, questions)
+    model = ai_models.get_model()
+
+    if len(questions) > 1:
+        try:
+            with telemetry.timer("prompt"):
+                prompt = build_batch_prompt(schema_prompt_part, questions)
+            with telemetry.timer("llm"):
+                text = model.generate(prompt, stages.LLM_TIMEOUT)
+            answers = split_batch_answer(text, len(questions))
+        except Exception as e:
+            log.error("AI batch error: %s", e)
+            telemetry.count("errors_llm")
+            answers = [None] * len(questions)
+    else:
+        try:
+            with telemetry.timer("prompt"):
+                prompt = build_prompt(schema_prompt_part, questions[0])
+            with telemetry.timer("llm"):
+                answers = [clean_sql(model.generate(prompt, stages.LLM_TIMEOUT))]
+        except Exception as e:
+            # General catch-all for other errors (network, parsing, etc.)
+            log.error("AI error: %s", e)
+            telemetry.count("errors_llm")
+            answers = [ai_error_message(e)]
+
+    if log.isEnabledFor(logging.DEBUG):
+        for question, answer in zip(questions, answers):
+            log.debug("AI generated SQL for %r: %s", question, answer)
+    return answers
+
+
+def ai_function(nlp_text: str, db_path: str, cancel: stages.CancelToken = None) -> str:
+    """Single-question form of ai_translate_many."""
+    return ai_translate_many(db_path, [nlp_text], cancel)[0]
+
+
+async def _run_ai_call(db_path: str, questions: List[str]) -> List[str]:
+    # One call may be shared by several requests, so no single request's
+    # CancelToken applies.
+    return await stages.run_stage(stages.llm_executor, stages.LLM_TIMEOUT, None, ai_translate_many, db_path, questions)
+
+
+async def _retry_ai_question(db_path: str, question: str) -> str:
     try:
-        # Instantiate the model first, then generate content
-        model = genai.GenerativeModel('gemini-2.5-flash-preview-09-2025')
-        response = model.generate_content(prompt)
-
-        # Basic cleanup
-        sql_query = response.text.strip()
-        sql_query = sql_query.replace('```sql', '').replace('```', '').strip()
-
-        if not sql_query or len(sql_query) < 5:
-             raise ValueError("Generated query is empty or too short.")
-        if not sql_query.endswith(';'):
-            sql_query += ';'
-
-        print(f"🧠 AI Generated SQL: {sql_query}")
-        return sql_query
-
-    # --- Catch specific API-related errors if possible ---
-    # (The exact exception type might vary depending on the library version)
-    # except google.api_core.exceptions.PermissionDenied as e:
-    #     print(f"❌ AI Error - Permission Denied (Check API Key): {e}")
-    #     return f"AI_ERROR: Permission Denied. Check your API key and ensure the API is enabled."
-    # except google.api_core.exceptions.NotFound as e:
-    #      print(f"❌ AI Error - Model Not Found: {e}")
-    #      return f"AI_ERROR: Model name might be incorrect or unavailable."
-    except Exception as e:
-        # General catch-all for other errors (network, parsing, etc.)
-        print(f"❌ AI Error: {e}")
-        # Check if the error message indicates an API key issue
-        if "api key" in str(e).lower():
-             return f"AI_ERROR: Invalid API Key or API not enabled: {e}"
-        return f"AI_ERROR: Error generating query: {e}"
+        return (await _run_ai_call(db_path, [question]))[0]
+    except stages.StageTimeout as e:
+        telemetry.count("errors_llm")
+        return f"AI_ERROR: AI function {e}"
+
+
+async def _run_ai_batch(db_path: str, questions: List[str]) -> List[str]:
+    """Answers for one dispatcher batch.
+
+    Questions the multi-question call leaves unanswered are retried as
+    single calls, in parallel, each under its own stage timeout.
+    """
+    answers = await _run_ai_call(db_path, questions)
+    retry = [i for i, answer in enumerate(answers) if answer is None]
+    if retry:
+        retried = await asyncio.gather(*(_retry_ai_question(db_path, questions[i]) for i in retry))
+        for i, answer in zip(retry, retried):
+            answers[i] = answer
+    return answers
+
+
+ai_dispatcher = ai_dispatch.AIDispatcher(_run_ai_batch)
 
 
 # --- Function to get full details for the frontend browser ---
-# (This remains unchanged)
+# Returns every table's schema and row count plus only the first page of its
+# rows, so the response stays small however large the database is. The rest
+# of each table is available from the /browse endpoints.
+BROWSE_PREVIEW_ROWS = int(os.getenv("BROWSE_PREVIEW_ROWS", "100"))
+
 def get_full_db_details(db_path: str):
     db_details = {}
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        for (table_name,) in tables:
-            if not table_name.replace('_', '').isalnum(): continue
-            cursor.execute(f"PRAGMA table_info({table_name});")
-            columns_data = cursor.fetchall()
-            schema_columns = [{"name": col[1], "type": col[2]} for col in columns_data]
-            content_headers = [col[1] for col in columns_data]
-            cursor.execute(f"SELECT * FROM {table_name};")
-            rows = cursor.fetchall()
-            db_details[table_name] = {
-                "schema": schema_columns,
-                "content": {"headers": content_headers, "rows": rows}
-            }
+        with db_pool.connection(db_path, readonly=True) as conn:
+            for table_name, info in db_browser.get_schema_with_counts(db_path, conn).items():
+                page = db_browser.fetch_page(db_path, table_name, conn, limit=BROWSE_PREVIEW_ROWS)
+                db_details[table_name] = {
+                    "schema": info["schema"],
+                    "row_count": info["row_count"],
+                    "content": {"headers": page["headers"], "rows": page["rows"]},
+                    "next_after": page["next_after"],
+                }
     except Exception as e: return {"error": str(e)}
-    finally:
-        if conn: conn.close()
     return {"db_details": db_details}
 
-# --- Main API Endpoint ---
-# (Logic remains the same as before, calls the updated ai_function)
-# ... (Keep imports and other functions like ai_function, get_db_schema_for_ai, get_full_db_details) ...
+# --- Shared pipeline stages ---
+# Used by both the single-query and the batch endpoints. The blocking parts
+# (Gemini, SQLite) run on the stage executors in routes/stages.py; the manual
+# parser is memoized and cheap enough to run inline.
 
-@router.get('/process')
-async def process_query(session_token: str, query: str):
-    token = session_token
-    if token not in session_map:
-        return {"error": "Invalid session. Please re-upload the database."}
+async def translate_query(query: str, db_path: str, cancel: stages.CancelToken, manual_sql: str = None):
+    """Turns one NL query into SQL, trying the manual parser first and then the AI.
 
-    db_path = session_map[token]
+    Returns (sql, origin, error, fingerprint). When manual_sql is given the
+    manual parser has already run (e.g. in a worker process) and is not
+    called again. fingerprint is set for a fresh AI translation: pass it to
+    remember_translation once the SQL has run without error.
+    """
+    sql_to_execute, origin, error, fingerprint = await _translate_query(query, db_path, cancel, manual_sql)
+    telemetry.count("errors_translate" if error else "origin_" + origin)
+    return sql_to_execute, origin, error, fingerprint
 
-    if query == "__GET_SCHEMA_AND_CONTENT__":
-        details = get_full_db_details(db_path)
-        # For this special query, we don't need SQL, just the result
-        return {"executed_sql": None, "result": details}
 
-    # --- NLP Query Processing Flow ---
+async def _translate_query(query: str, db_path: str, cancel: stages.CancelToken, manual_sql: str = None):
     sql_to_execute = "unknown error" # Default value
     origin = "manual" # Track where the SQL came from
 
     # 1. Try Manual Function
-    try:
-        manual_result_list = manualFunction.nl2sql([query])
-        sql_to_execute = manual_result_list[0]
-    except Exception as e:
-        print(f"Manual function error: {e}")
-        sql_to_execute = "unknown error"
+    if manual_sql is not None:
+        sql_to_execute = manual_sql
+    else:
+        try:
+            with telemetry.timer("manual"):
+                manual_result_list = manualFunction.nl2sql([query])
+            sql_to_execute = manual_result_list[0]
+        except Exception as e:
+            log.error("Manual function error: %s", e)
+            sql_to_execute = "unknown error"
 
-    # 2. If Manual Function failed, try AI Function
+    # 2. If Manual Function failed, try the translation cache, then the AI Function
     if sql_to_execute == "unknown error":
+        try:
+            with telemetry.timer("cache"):
+                fingerprint, cached_sql = await stages.run_stage(
+                    stages.db_executor, stages.DB_TIMEOUT, cancel, lookup_translation, query, db_path
+                )
+        except Exception as e:
+            log.error("Translation cache lookup error: %s", e)
+            fingerprint, cached_sql = None, None
+        if cached_sql:
+            return cached_sql, "ai_cache", None, None
+
         origin = "ai" # Mark as AI generated
-        print(f"Manual function failed for: '{query}'. Trying AI...")
+        log.debug("Manual function failed for %r; trying AI", query)
         try:
-            sql_to_execute = ai_function(query, db_path)
+            # Identical questions against the same schema share one AI call.
+            # "ai_wait" includes time spent waiting for a batch to fill.
+            with telemetry.timer("ai_wait"):
+                sql_to_execute = await ai_dispatcher.submit(
+                    fingerprint or db_path, translation_cache.normalize_question(query), query, db_path
+                )
+        except stages.StageTimeout as e:
+            return None, origin, f"AI function {e}", None
         except Exception as e:
-           print(f"AI function execution error: {e}")
-           # Return error and null SQL
-           return {"executed_sql": None, "error": f"AI function failed during execution: {e}"}
+           log.error("AI function execution error: %s", e)
+           return None, origin, f"AI function failed during execution: {e}", None
 
         if sql_to_execute.startswith("AI_ERROR:"):
-             # Return error and null SQL
-             return {"executed_sql": None, "error": sql_to_execute}
+             return None, origin, sql_to_execute, None
+
+        return sql_to_execute, origin, None, fingerprint
+
+    return sql_to_execute, origin, None, None
+
+
+async def remember_translation(query: str, fingerprint: str, sql: str, cancel: stages.CancelToken = None):
+    """Stores an AI translation in the translation cache, once its SQL has run without error.
+
+    fingerprint is the one translate_query returned: a DDL statement changes
+    the schema, but is only valid against the schema it was written for.
+    """
+    if not fingerprint:
+        return
+    try:
+        await stages.run_stage(
+            stages.db_executor, stages.DB_TIMEOUT, cancel, translation_cache.put, query, fingerprint, sql
+        )
+    except Exception as e:
+        log.error("Translation cache store error: %s", e)
+
+
+def lookup_translation(query: str, db_path: str):
+    """Returns (schema fingerprint, cached AI translation or None) for a query."""
+    with db_pool.connection(db_path, readonly=True) as conn:
+        fingerprint = schema_cache.get_fingerprint(db_path, conn)
+    return fingerprint, translation_cache.get(query, fingerprint)
 
-    # 3. Execute the SQL (from either manual or AI)
-    conn = None
-    result_data = None # Store the data/message here
-    error_message = None # Store potential errors here
 
+def open_select(db_path: str, sql_to_execute: str, offset: int = 0, cancel: stages.CancelToken = None,
+                max_rows: int = None):
+    """Executes a SELECT (resumed at offset, if given) on a read-only pooled connection.
+
+    A first page is checked by the query guard first, which may raise
+    query_guard.QueryRejectedError or cap the statement at max_rows rows.
+    Returns the checked-out (conn, cursor, budget, warnings, executed_sql),
+    where executed_sql is the statement as run; the caller must
+    db_pool.release(conn), and fetch under stages.interruptible with budget.
+    """
+    conn = db_pool.checkout(db_path, readonly=True)
     try:
-        conn = sqlite3.connect(db_path)
+        warnings = []
+        if not offset:
+            with telemetry.timer("plan"):
+                check = query_guard.check_select(
+                    conn, db_path, sql_to_execute, max_rows or query_results.RESULT_MAX_ROWS
+                )
+            sql_to_execute, warnings = check.sql, check.warnings
+            if check.cartesian:
+                telemetry.count("guard_cartesian")
+            if check.limited:
+                telemetry.count("guard_limited")
+            telemetry.count("guard_full_scans", len(check.full_scans))
+        budget = query_guard.new_budget(stages.PROGRESS_STEPS)
         cursor = conn.cursor()
+        with stages.interruptible(conn, cancel, budget), telemetry.timer("execute"):
+            if offset:
+                cursor.execute(query_results.paged_sql(sql_to_execute), (offset,))
+            else:
+                cursor.execute(sql_to_execute)
+        return conn, cursor, budget, warnings, sql_to_execute
+    except Exception:
+        db_pool.release(conn)
+        raise
+
+
+class WriteRequiredError(Exception):
+    """A statement run with writable=False tried to write."""
+
 
-        print(f"Executing SQL ({origin}): {sql_to_execute}")
-        cursor.execute(sql_to_execute)
+def _is_readonly_error(e: sqlite3.Error) -> bool:
+    name = getattr(e, "sqlite_errorname", None)
+    return name.startswith("SQLITE_READONLY") if name else "readonly database" in str(e)
 
-        is_select_query = sql_to_execute.strip().lower().startswith("select")
 
-        if is_select_query:
+def execute_sql(db_path: str, sql_to_execute: str, origin: str, offset: int = 0, cancel: stages.CancelToken = None,
+                use_cache: bool = True, writable: bool = True):
+    """Runs one statement against the session DB. Returns (result_data, error_message).
+
+    SELECT results stop after RESULT_MAX_ROWS rows; "next_offset" in the
+    result says where the next page starts (None when there is no more).
+    Unless use_cache is False, a SELECT is answered from result_cache while
+    the database hasn't changed. Setting cancel aborts the statement.
+    Other statements that return rows (WITH, PRAGMA, EXPLAIN, RETURNING)
+    give one capped page. With writable=False they run on a query_only
+    connection, and one that tries to write raises WriteRequiredError.
+    """
+    conn = None
+    result_data = None # Store the data/message here
+    error_message = None # Store potential errors here
+
+    try:
+        log.debug("Executing SQL (%s): %s", origin, sql_to_execute)
+        if is_select(sql_to_execute):
+            version = None
+            if use_cache and result_cache.cacheable(sql_to_execute):
+                with telemetry.timer("result_cache"):
+                    cached, version = result_cache.get(db_path, sql_to_execute, offset)
+                if cached is not None:
+                    return dict(cached), None # Copied: with_next_token edits the result
+            conn, cursor, budget, warnings, executed_sql = open_select(db_path, sql_to_execute, offset, cancel)
             headers = [description[0] for description in cursor.description] if cursor.description else []
-            rows = cursor.fetchall()
-            result_data = {"headers": headers, "rows": rows} # Store data object
+            with stages.interruptible(conn, cancel, budget), telemetry.timer("fetch"):
+                rows, has_more = query_results.fetch_bounded(cursor, query_results.RESULT_MAX_ROWS)
+            cursor.close() # Finish the statement before the connection goes back to the pool
+            next_offset = offset + len(rows) if has_more else None
+            result_data = {"headers": headers, "rows": rows, "next_offset": next_offset, "executed_sql": executed_sql}
+            if warnings:
+                result_data["warnings"] = warnings
+            if version is not None:
+                result_cache.put(db_path, sql_to_execute, offset, version, dict(result_data))
         else:
-            conn.commit()
-            result_data = f"{cursor.rowcount} rows affected." # Store message string
+            conn = db_pool.checkout(db_path, readonly=not writable)
+            cursor = conn.cursor()
+            budget = query_guard.new_budget(stages.PROGRESS_STEPS)
+            with stages.interruptible(conn, cancel, budget), telemetry.timer("execute"):
+                try:
+                    cursor.execute(sql_to_execute)
+                except sqlite3.OperationalError as e:
+                    if not writable and _is_readonly_error(e):
+                        raise WriteRequiredError(str(e)) from e
+                    raise
+                if cursor.description:
+                    headers = [description[0] for description in cursor.description]
+                    rows, has_more = query_results.fetch_bounded(cursor, query_results.RESULT_MAX_ROWS)
+                    result_data = {"headers": headers, "rows": rows, "next_offset": None, "executed_sql": sql_to_execute}
+                    if has_more:
+                        result_data["warnings"] = [f"Result cut at {len(rows)} rows."]
+                    cursor.close()
+                else:
+                    result_data = f"{cursor.rowcount} rows affected." # Store message string
+                conn.commit()
+            if writable and schema_cache.is_ddl(sql_to_execute):
+                schema_cache.invalidate(db_path)
+
+    except WriteRequiredError:
+        raise
 
+    except query_guard.QueryRejectedError as e:
+        error_message = f"Query Guard: {e}"
+        telemetry.count("guard_stopped" if isinstance(e, query_guard.BudgetExceededError) else "guard_rejected")
+        log.info("Query guard: %s for SQL: %s", e, sql_to_execute)
     except sqlite3.Error as e:
         error_message = f"Database Error: {e}"
-        print(f"❌ Database Error: {e} for SQL: {sql_to_execute}")
+        telemetry.count("errors_sql")
+        log.debug("Database error: %s for SQL: %s", e, sql_to_execute)
     except Exception as e:
         error_message = f"Execution Error: {e}"
-        print(f"❌ Execution Error: {e} for SQL: {sql_to_execute}")
+        telemetry.count("errors_sql")
+        log.warning("Execution error: %s for SQL: %s", e, sql_to_execute)
     finally:
         if conn:
-            conn.close()
+            db_pool.release(conn)
+
+    return result_data, error_message
+
+
+async def run_sql(db_path: str, sql_to_execute: str, origin: str, cancel: stages.CancelToken, offset: int = 0,
+                  use_cache: bool = True, writable: bool = True):
+    """execute_sql on the DB executor, with the DB stage timeout applied."""
+    try:
+        return await stages.run_stage(
+            stages.db_executor, stages.DB_TIMEOUT, cancel,
+            execute_sql, db_path, sql_to_execute, origin, offset, cancel, use_cache, writable,
+        )
+    except stages.StageTimeout as e:
+        telemetry.count("errors_timeout")
+        return None, f"Database Error: query {e}"
+
+
+async def session_writable_path(session_token: str):
+    """The session's own copy of its database (see db_store), made before its first write."""
+    return await stages.run_stage(stages.io_executor, stages.IO_TIMEOUT, None, db_store.writable_path, session_token)
+
+
+async def run_session_sql(session_token: str, db_path: str, sql_to_execute: str, origin: str,
+                          cancel: stages.CancelToken, use_cache: bool = True):
+    """run_sql for a session, copying its database only for a statement that writes.
+
+    A session shares its uploaded database until it first writes. Anything
+    but a SELECT is tried on a query_only connection first; only when SQLite
+    refuses the write does the session get its own copy, where it runs again.
+    """
+    if not is_select(sql_to_execute) and db_path != db_store.private_path(session_token):
+        try:
+            return await run_sql(db_path, sql_to_execute, origin, cancel, use_cache=use_cache, writable=False)
+        except WriteRequiredError:
+            db_path = await session_writable_path(session_token)
+            if db_path is None:
+                return None, "Session expired. Please re-upload the database."
+    return await run_sql(db_path, sql_to_execute, origin, cancel, use_cache=use_cache)
+
+
+def is_select(sql: str) -> bool:
+    return sql.strip().lower().startswith("select")
+
+
+def with_next_token(result_data, session_token: str, sql_to_execute: str):
+    """Swaps the internal keys of a SELECT result for what the client sees.
+
+    Returns (executed SQL, result). The query guard may have rewritten the
+    statement; the continuation token resumes the one that actually ran.
+    """
+    if isinstance(result_data, dict):
+        sql_to_execute = result_data.pop("executed_sql", sql_to_execute)
+        if "next_offset" in result_data:
+            next_offset = result_data.pop("next_offset")
+            result_data["next_token"] = (
+                query_results.make_token(session_token, sql_to_execute, next_offset)
+                if next_offset is not None else None
+            )
+    return sql_to_execute, result_data
+
+
+async def stream_select(session_token: str, db_path: str, sql_to_execute: str, cancel: stages.CancelToken, offset: int = 0):
+    """NDJSON StreamingResponse for a SELECT, or an error dict if it fails to execute.
+
+    The query guard checks the plan, but the step budget only covers running
+    the statement up to its first row: the client sets the pace after that.
+    """
+    try:
+        conn, cursor, _, _, executed_sql = await stages.run_stage(
+            stages.db_executor, stages.DB_TIMEOUT, cancel, open_select, db_path, sql_to_execute, offset, cancel,
+            query_results.RESULT_STREAM_MAX_ROWS,
+        )
+    except stages.StageTimeout as e:
+        return {"executed_sql": sql_to_execute, "result": f"Database Error: query {e}"}
+    except query_guard.QueryRejectedError as e:
+        telemetry.count("guard_stopped" if isinstance(e, query_guard.BudgetExceededError) else "guard_rejected")
+        return {"executed_sql": sql_to_execute, "result": f"Query Guard: {e}"}
+    except sqlite3.Error as e:
+        return {"executed_sql": sql_to_execute, "result": f"Database Error: {e}"}
+    except Exception as e:
+        return {"executed_sql": sql_to_execute, "result": f"Execution Error: {e}"}
+
+    def next_token_for(rows_sent):
+        return query_results.make_token(session_token, executed_sql, offset + rows_sent)
+
+    body = db_pool.StreamBody(
+        query_results.iter_ndjson(cursor, executed_sql, next_token_for, query_results.RESULT_STREAM_MAX_ROWS),
+        conn, cursor,
+    )
+    return StreamingResponse(body, media_type="application/x-ndjson", background=BackgroundTask(body.close))
+
+
+# --- Main API Endpoint ---
+# With stream=true a SELECT is sent as NDJSON (see query_results.iter_ndjson)
+# instead of one JSON body. Either way a result that hits the row cap comes
+# with a next_token for /process/next. SELECT results are cached per database
+# (functions/result_cache); cache=false runs the query regardless. `format`
+# (or the Accept header) picks a faster encoding; see functions/response_format.
+
+@router.get('/process')
+@response_format.negotiated
+async def process_query(request: Request, session_token: str, query: str, stream: bool = False, cache: bool = True,
+                        format: Optional[str] = None):
+    token = session_token
+    db_path = await db_store.resolve_session(token)
+    if db_path is None:
+        return {"error": "Invalid session. Please re-upload the database."}
+
+    async with stages.cancel_on_disconnect(request) as cancel:
+        if query == "__GET_SCHEMA_AND_CONTENT__":
+            try:
+                details = await stages.run_stage(
+                    stages.db_executor, stages.DB_TIMEOUT, cancel, get_full_db_details, db_path
+                )
+            except stages.StageTimeout as e:
+                details = {"error": f"Loading the database {e}"}
+            # For this special query, we don't need SQL, just the result
+            return {"executed_sql": None, "result": details}
+
+        # --- NLP Query Processing Flow ---
+        sql_to_execute, origin, error, fingerprint = await translate_query(query, db_path, cancel)
+        if error:
+            # Return error and null SQL
+            return {"executed_sql": None, "error": error}
+
+        if stream and is_select(sql_to_execute):
+            log.debug("Streaming SQL (%s): %s", origin, sql_to_execute)
+            response = await stream_select(token, db_path, sql_to_execute, cancel)
+            if isinstance(response, StreamingResponse):
+                await remember_translation(query, fingerprint, sql_to_execute, cancel)
+            return response
+
+        # 3. Execute the SQL (from either manual or AI)
+        result_data, error_message = await run_session_sql(token, db_path, sql_to_execute, origin, cancel, cache)
+        if not error_message:
+            await remember_translation(query, fingerprint, sql_to_execute, cancel)
 
     # --- Return Executed SQL and Result/Error ---
     if error_message:
@@ -228,4 +609,160 @@ async def process_query(session_token: str, query: str):
         return {"executed_sql": sql_to_execute, "result": error_message}
     else:
         # Otherwise, return the successful result
-        return {"executed_sql": sql_to_execute, "result": result_data}
\ No newline at end of file
+        executed_sql, result_data = with_next_token(result_data, token, sql_to_execute)
+        return {"executed_sql": executed_sql, "result": result_data}
+
+
+@router.get('/process/next')
+@response_format.negotiated
+async def process_next(request: Request, session_token: str, cursor: str, stream: bool = False, cache: bool = True,
+                       format: Optional[str] = None):
+    """Fetches the page of a capped SELECT result that a next_token points at."""
+    db_path = await db_store.resolve_session(session_token)
+    if db_path is None:
+        return {"error": "Invalid session. Please re-upload the database."}
+    try:
+        sql_to_execute, offset = query_results.read_token(cursor, session_token)
+    except query_results.InvalidTokenError as e:
+        return {"executed_sql": None, "error": str(e)}
+
+    async with stages.cancel_on_disconnect(request) as cancel:
+        if stream:
+            return await stream_select(session_token, db_path, sql_to_execute, cancel, offset)
+
+        result_data, error_message = await run_sql(db_path, sql_to_execute, "continuation", cancel, offset, cache)
+
+    if error_message:
+        return {"executed_sql": sql_to_execute, "result": error_message}
+    executed_sql, result_data = with_next_token(result_data, session_token, sql_to_execute)
+    return {"executed_sql": executed_sql, "result": result_data}
+
+
+# --- Batch API Endpoint ---
+# Manual translation is CPU-bound regex work, so large batches are spread over
+# a process pool. AI fallback and execution then go through the same stage
+# executors as /process, which bound how many run at once. All AI fallbacks
+# are requested together, before anything runs. Consecutive SELECTs then run
+# concurrently; any other statement is a barrier, so the batch sees the same
+# data as if it had run one statement at a time.
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "1000"))
+BATCH_TRANSLATE_WORKERS = int(os.getenv("BATCH_TRANSLATE_WORKERS", str(os.cpu_count() or 1)))
+BATCH_CHUNK_SIZE = 64 # Statements per process-pool task; smaller batches translate inline
+
+_translate_pool = None
+
+
+def _get_translate_pool():
+    global _translate_pool
+    if _translate_pool is None:
+        _translate_pool = ProcessPoolExecutor(max_workers=BATCH_TRANSLATE_WORKERS)
+    return _translate_pool
+
+
+class BatchRequest(BaseModel):
+    session_token: str
+    queries: List[str]
+    cache: bool = True # False bypasses the SELECT result cache
+
+
+async def _translate_batch(queries: List[str]) -> List[str]:
+    """Manual-parser SQL for every query, in order ("unknown error" where it fails)."""
+    if len(queries) <= BATCH_CHUNK_SIZE or BATCH_TRANSLATE_WORKERS <= 1:
+        return manualFunction.nl2sql_each(queries)
+
+    loop = asyncio.get_running_loop()
+    pool = _get_translate_pool()
+    chunks = [queries[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(queries), BATCH_CHUNK_SIZE)]
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, manualFunction.nl2sql_each, chunk) for chunk in chunks)
+    )
+    return [sql for chunk in results for sql in chunk]
+
+
+async def _session_expired(query: str):
+    return {"query": query, "executed_sql": None, "error": "Session expired. Please re-upload the database."}
+
+
+async def _translate_batch_item(query: str, manual_sql: str, db_path: str, cancel: stages.CancelToken):
+    try:
+        return await translate_query(query, db_path, cancel, manual_sql)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return None, None, f"Batch item failed: {e}", None
+
+
+async def _run_batch_item(query: str, translation, db_path: str, session_token: str, cancel: stages.CancelToken,
+                          use_cache: bool = True):
+    """Executes one translated batch item. translation is what translate_query returned."""
+    sql_to_execute, origin, error, fingerprint = translation
+    try:
+        if error:
+            return {"query": query, "executed_sql": None, "error": error}
+        result_data, error_message = await run_session_sql(session_token, db_path, sql_to_execute, origin, cancel, use_cache)
+        if error_message:
+            return {"query": query, "executed_sql": sql_to_execute, "origin": origin, "error": error_message}
+        await remember_translation(query, fingerprint, sql_to_execute, cancel)
+        executed_sql, result_data = with_next_token(result_data, session_token, sql_to_execute)
+        return {"query": query, "executed_sql": executed_sql, "origin": origin, "result": result_data}
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return {"query": query, "executed_sql": None, "error": f"Batch item failed: {e}"}
+
+
+@router.post('/process_batch')
+@response_format.negotiated
+async def process_batch(request: Request, batch: BatchRequest, format: Optional[str] = None):
+    if await db_store.resolve_session(batch.session_token) is None:
+        return {"error": "Invalid session. Please re-upload the database."}
+    if len(batch.queries) > BATCH_MAX_SIZE:
+        return {"error": f"Batch too large: {len(batch.queries)} queries (max {BATCH_MAX_SIZE})."}
+
+    try:
+        manual_sqls = await _translate_batch(batch.queries)
+    except Exception as e:
+        log.error("Batch translation error: %s", e)
+        manual_sqls = ["unknown error"] * len(batch.queries)
+
+    results = [None] * len(batch.queries)
+    pending = [] # Indexes of read-only items that may run together
+
+    async with stages.cancel_on_disconnect(request) as cancel:
+        # Every item is translated up front, so the AI fallbacks run in
+        # parallel and the dispatcher can put them in one model call. They see
+        # the schema as it was when the batch started.
+        db_path = await db_store.resolve_session(batch.session_token)
+        if db_path is None:
+            return {"error": "Session expired. Please re-upload the database."}
+        translations = await asyncio.gather(*(
+            _translate_batch_item(query, manual_sql, db_path, cancel)
+            for query, manual_sql in zip(batch.queries, manual_sqls)
+        ))
+
+        async def run_item(i):
+            # Looked up per item: a write earlier in the batch may have given
+            # the session its own copy of the database.
+            db_path = await db_store.resolve_session(batch.session_token)
+            if db_path is None:
+                return await _session_expired(batch.queries[i])
+            return await _run_batch_item(batch.queries[i], translations[i], db_path, batch.session_token, cancel, batch.cache)
+
+        async def flush():
+            if not pending:
+                return
+            done = await asyncio.gather(*(run_item(i) for i in pending))
+            for i, item in zip(pending, done):
+                results[i] = item
+            pending.clear()
+
+        for i, (sql_to_execute, _, error, _) in enumerate(translations):
+            if not error and is_select(sql_to_execute):
+                pending.append(i)
+                continue
+            await flush()
+            results[i] = await run_item(i)
+        await flush()
+
+    return {"results": results}
@@ -0,0 +1,170 @@
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl # Cross-process locking; not available on Windows
+except ImportError:
+    fcntl = None
+
+# --- Session store ---
+# Maps session tokens to their records ({"blob", "private", "last_used"}; see
+# db_store). SESSION_STORE picks the backend:
+#   * "sqlite" (default): a SQLite file that every worker process on the host
+#     shares, so a token issued by one uvicorn worker works on all of them.
+#     Each process caches records in memory and drops its cache whenever
+#     another process has changed the file (PRAGMA data_version).
+#   * "memory": a dict in this process, for a single worker.
+# lock() serializes multi-step changes (upload, copy-on-write, eviction)
+# across threads and, for the SQLite backend, across processes.
+# secret() hands out random keys that every process sharing the store agrees
+# on (e.g. for signing continuation tokens), kept in a "meta" table.
+
+log = logging.getLogger(__name__)
+
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite").lower()
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(os.getenv("DB_STORE_FOLDER", "temp_db_files"), "sessions.db"))
+
+
+class MemorySessionStore:
+    def __init__(self):
+        self._sessions = {}
+        self._secrets = {}
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def lock(self):
+        with self._lock:
+            yield
+
+    def get(self, token: str):
+        record = self._sessions.get(token)
+        return dict(record) if record else None
+
+    def put(self, token: str, record):
+        self._sessions[token] = dict(record)
+
+    def update(self, token: str, **fields):
+        record = self._sessions.get(token)
+        if record:
+            record.update(fields)
+
+    def delete(self, token: str):
+        self._sessions.pop(token, None)
+
+    def items(self):
+        """[(token, record)] for every session."""
+        return [(token, dict(record)) for token, record in list(self._sessions.items())]
+
+    def secret(self, name: str) -> str:
+        """A random hex key for name, made on first use."""
+        with self._lock:
+            return self._secrets.setdefault(name, secrets.token_hex(32))
+
+
+class SQLiteSessionStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "token TEXT PRIMARY KEY, blob TEXT NOT NULL, private INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn_lock = threading.Lock() # One statement at a time on the shared connection
+        self._lock = threading.RLock()
+        self._lock_file = open(path + ".lock", "a")
+        self._lock_depth = 0
+        self._cache = {} # token -> record, or None for a token known not to exist
+        self._data_version = None
+
+    @contextmanager
+    def lock(self):
+        with self._lock:
+            if self._lock_depth == 0 and fcntl:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _check_cache(self):
+        """Empties the cache if another process wrote to the store. Caller holds _conn_lock."""
+        data_version = self._conn.execute("PRAGMA data_version;").fetchone()[0]
+        if data_version != self._data_version:
+            self._cache.clear()
+            self._data_version = data_version
+
+    @staticmethod
+    def _record(row):
+        return {"blob": row[0], "private": bool(row[1]), "last_used": row[2]}
+
+    def get(self, token: str):
+        with self._conn_lock:
+            self._check_cache()
+            if token in self._cache:
+                record = self._cache[token]
+            else:
+                row = self._conn.execute(
+                    "SELECT blob, private, last_used FROM sessions WHERE token = ?;", (token,)
+                ).fetchone()
+                record = self._record(row) if row else None
+                self._cache[token] = record
+        return dict(record) if record else None
+
+    def put(self, token: str, record):
+        with self._conn_lock:
+            self._check_cache()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (token, blob, private, last_used) VALUES (?, ?, ?, ?);",
+                (token, record["blob"], int(record["private"]), record["last_used"]),
+            )
+            self._cache[token] = dict(record)
+
+    def update(self, token: str, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        values = [int(v) if name == "private" else v for name, v in fields.items()]
+        with self._conn_lock:
+            self._check_cache()
+            self._conn.execute(f"UPDATE sessions SET {columns} WHERE token = ?;", (*values, token))
+            if self._cache.get(token):
+                self._cache[token].update(fields)
+
+    def delete(self, token: str):
+        with self._conn_lock:
+            self._check_cache()
+            self._conn.execute("DELETE FROM sessions WHERE token = ?;", (token,))
+            self._cache[token] = None
+
+    def items(self):
+        """[(token, record)] for every session."""
+        with self._conn_lock:
+            rows = self._conn.execute("SELECT token, blob, private, last_used FROM sessions;").fetchall()
+        return [(row[0], self._record(row[1:])) for row in rows]
+
+    def secret(self, name: str) -> str:
+        """A random hex key for name, made by whichever process asks first and then shared."""
+        with self._conn_lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO meta (name, value) VALUES (?, ?);", (name, secrets.token_hex(32))
+            )
+            return self._conn.execute("SELECT value FROM meta WHERE name = ?;", (name,)).fetchone()[0]
+
+
+def create_store():
+    if SESSION_STORE == "memory":
+        return MemorySessionStore()
+    if SESSION_STORE != "sqlite":
+        log.warning("Unknown SESSION_STORE %r; using sqlite.", SESSION_STORE)
+    if fcntl is None:
+        log.warning("No cross-process file locking here; run a single worker.")
+    return SQLiteSessionStore(SESSION_STORE_PATH)
@@ -0,0 +1,118 @@
+import asyncio
+import contextvars
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from functions import query_guard
+
+# --- Pipeline stage executors ---
+# Blocking work never runs on the event loop. LLM calls, SQLite work and
+# upload file I/O each get their own thread pool, so the pool sizes double as
+# concurrency limits: a burst of slow Gemini calls can't starve queries, and
+# vice versa. Each stage has its own timeout; when it expires (or the client
+# goes away) the request's CancelToken is set, which interrupts a running
+# SQLite statement through its progress handler. The same handler enforces the
+# per-statement budget of functions/query_guard.
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "16"))
+IO_MAX_CONCURRENCY = int(os.getenv("IO_MAX_CONCURRENCY", "4"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "60"))
+IO_TIMEOUT = float(os.getenv("IO_TIMEOUT", "300"))
+PROGRESS_STEPS = 1000 # SQLite VM instructions between cancellation checks
+DISCONNECT_POLL_INTERVAL = 0.25
+
+llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="db")
+io_executor = ThreadPoolExecutor(max_workers=IO_MAX_CONCURRENCY, thread_name_prefix="io")
+
+
+class StageTimeout(Exception):
+    pass
+
+
+class CancelToken:
+    """Set once a request no longer needs its result; checked by blocking work."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def progress_handler(self) -> int:
+        # A non-zero return makes SQLite abort the statement ("interrupted").
+        return 1 if self._event.is_set() else 0
+
+
+@contextmanager
+def interruptible(conn, cancel: CancelToken = None, budget: query_guard.Budget = None):
+    """Lets cancel abort statements run on conn inside the block, as does running over budget.
+
+    A statement stopped by its budget raises query_guard.BudgetExceededError.
+    """
+    if cancel is None and budget is None:
+        yield conn
+        return
+
+    def progress_handler():
+        if cancel is not None and cancel.progress_handler():
+            return 1
+        return budget.progress_handler() if budget is not None else 0
+
+    conn.set_progress_handler(progress_handler, PROGRESS_STEPS)
+    try:
+        yield conn
+    except sqlite3.OperationalError:
+        if budget is not None and budget.exceeded:
+            raise query_guard.BudgetExceededError(f"stopped after {budget.exceeded}.") from None
+        raise
+    finally:
+        conn.set_progress_handler(None, PROGRESS_STEPS)
+
+
+async def run_stage(executor, timeout: float, cancel: CancelToken, fn, *args):
+    """Runs fn(*args) on executor, giving up (and cancelling) after timeout seconds."""
+    loop = asyncio.get_running_loop()
+    # Carry the request's context (e.g. its stage timings) into the worker thread.
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(executor, context.run, fn, *args)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        if cancel is not None:
+            cancel.cancel()
+        raise StageTimeout(f"timed out after {timeout:g}s")
+    except asyncio.CancelledError:
+        if cancel is not None:
+            cancel.cancel()
+        raise
+
+
+@asynccontextmanager
+async def cancel_on_disconnect(request):
+    """Yields a CancelToken that is set, and the handler cancelled, if the client disconnects."""
+    cancel = CancelToken()
+    handler_task = asyncio.current_task()
+
+    async def watch():
+        while not cancel.cancelled:
+            if await request.is_disconnected():
+                cancel.cancel()
+                handler_task.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    watcher = asyncio.create_task(watch())
+    try:
+        yield cancel
+    finally:
+        watcher.cancel()
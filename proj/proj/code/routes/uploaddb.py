@@ -1,24 +1,145 @@
-from fastapi import APIRouter, File, UploadFile
-import uuid
-import shutil
-import os
-from globals import session_map
+from fastapi import APIRouter, Request
+from routes import db_store
+from routes import stages
+
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError: # python-multipart < 0.0.13
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
 
 router = APIRouter()
 
-UPLOAD_FOLDER = "temp_db_files"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1024 * 1024 # Bytes of request body handed to the I/O executor per step
+
+# Uploads are streamed into the content-addressed store (see db_store): the
+# same database uploaded twice is kept once. The response includes the
+# file's sha256; a client that already uploaded a file can pass it to
+# /upload_db/by_hash to start a new session without sending the file again.
+# The multipart body is parsed here as it arrives rather than by FastAPI's
+# UploadFile, which spools the whole file to a temporary file first: the
+# "file" part goes straight into the store, so it is written to disk once,
+# and the SQLite header and the quota are checked on the first bytes.
+
+_UPLOAD_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    },
+}
+
+
+class _FormUpload:
+    """Feeds a multipart/form-data body to a db_store.Upload for its "file" part.
+
+    feed() blocks (it writes to disk); call it from the I/O executor.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.upload = None
+        self._headers = {}
+        self._field = self._value = b""
+        self._in_file = False
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") != b"file" or self.upload is not None:
+            return
+        if not options.get(b"filename", b"").decode("utf-8", "replace").endswith(".db"):
+            raise db_store.InvalidDatabaseError("Only .db files are allowed")
+        self.upload = db_store.Upload()
+        self._in_file = True
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self.upload.write(data[start:end])
+
+    def _on_part_end(self):
+        self._in_file = False
+
+    def feed(self, data: bytes):
+        self._parser.write(data)
+
+    def finish(self) -> str:
+        self._parser.finalize()
+        if self.upload is None:
+            raise db_store.InvalidDatabaseError("No file uploaded.")
+        return self.upload.finish()
+
+    def abort(self):
+        if self.upload is not None:
+            self.upload.abort()
+
+
+async def _run_io(fn, *args):
+    return await stages.run_stage(stages.io_executor, stages.IO_TIMEOUT, None, fn, *args)
+
+
+@router.post("/upload_db/", openapi_extra=_UPLOAD_FORM)
+async def upload_db(request: Request):
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        return {"error": "Upload the database as multipart/form-data, in a field named file."}
 
-@router.post("/upload_db/")
-async def upload_db(file: UploadFile = File(...)):
-    if not file.filename.endswith(".db"):
-        return {"error": "Only .db files are allowed"}
+    # Body chunks are awaited; parsing, hashing and writing run on the I/O
+    # executor, so a large upload never blocks the event loop.
+    form = _FormUpload(options[b"boundary"])
+    try:
+        pending, pending_size = [], 0
+        async for chunk in request.stream():
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if pending_size >= UPLOAD_CHUNK_SIZE:
+                await _run_io(form.feed, b"".join(pending))
+                pending, pending_size = [], 0
+        await _run_io(form.feed, b"".join(pending))
+        sha256 = await _run_io(form.finish)
+    except (db_store.InvalidDatabaseError, db_store.QuotaExceededError) as e:
+        await _run_io(form.abort)
+        return {"error": str(e)}
+    except MultipartParseError as e:
+        await _run_io(form.abort)
+        return {"error": f"Malformed upload: {e}"}
+    except BaseException:
+        await _run_io(form.abort)
+        raise
 
-    temp_filename = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}_{file.filename}")
-    with open(temp_filename, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    session_token = await _run_io(db_store.open_session, sha256)
+    if session_token is None:
+        return {"error": "Database was removed before the session started; please upload it again."}
+    return {"session_token": session_token, "sha256": sha256}
 
-    session_token = str(uuid.uuid4())
-    session_map[session_token] = temp_filename
 
-    return {"session_token": session_token}
\ No newline at end of file
+@router.post("/upload_db/by_hash")
+async def upload_db_by_hash(sha256: str):
+    session_token = await stages.run_stage(stages.io_executor, stages.IO_TIMEOUT, None, db_store.open_session, sha256.lower())
+    if session_token is None:
+        return {"error": "Unknown database; please upload the file."}
+    return {"session_token": session_token, "sha256": sha256.lower()}
@@ -0,0 +1,29 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time, so point every file it
+# writes at a scratch directory before any test imports it.
+_SCRATCH = tempfile.mkdtemp(prefix="nl2sql-tests-")
+os.environ.update({
+    "AI_MODEL": "stub",
+    "DB_STORE_FOLDER": os.path.join(_SCRATCH, "store"),
+    "TRANSLATION_CACHE_PATH": os.path.join(_SCRATCH, "translation_cache.db"),
+    "LOG_LEVEL": "WARNING",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sample_db(tmp_path):
+    """A small users table, as a database file of its own."""
+    path = str(tmp_path / "sample.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, age INTEGER);")
+    conn.executemany("INSERT INTO users (name, age) VALUES (?, ?);", [("alice", 30), ("bob", 25), ("carol", 41)])
+    conn.commit()
+    conn.close()
+    return path
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from functions import ai_dispatch
+from functions import ai_models
+from routes import process
+
+
+class RecordingBatches:
+    """run_batch for an AIDispatcher that records every call it gets."""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, context, questions):
+        self.calls.append(list(questions))
+        await asyncio.sleep(self.delay)
+        return [f"SELECT '{q}';" for q in questions]
+
+
+class DroppingModel(ai_models.StubModel):
+    """Stub whose multi-question answers leave out the parts listed in drop."""
+
+    def __init__(self, drop=()):
+        super().__init__()
+        self.drop = set(drop)
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        answer = super().generate(prompt, timeout)
+        if not self._NUMBERED_RE.search(prompt):
+            return answer
+        parts = process._BATCH_HEADER_RE.split(answer)
+        return "\n".join(
+            f"### {number}\n{body.strip()}"
+            for number, body in zip(parts[1::2], parts[2::2]) if int(number) not in self.drop
+        )
+
+
+class FailingBatchModel(ai_models.StubModel):
+    def generate(self, prompt: str, timeout: float) -> str:
+        if self._NUMBERED_RE.search(prompt):
+            with self._lock:
+                self.calls += 1
+            raise RuntimeError("overloaded")
+        return super().generate(prompt, timeout)
+
+
+@pytest.fixture
+def model():
+    previous = ai_models.get_model()
+    yield lambda m: ai_models.set_model(m) or m
+    ai_models.set_model(previous)
+
+
+# --- AIDispatcher ---
+
+def test_identical_questions_share_one_call():
+    run_batch = RecordingBatches()
+    dispatcher = ai_dispatch.AIDispatcher(run_batch, window=0.01, max_batch=8)
+
+    async def ask():
+        return await asyncio.gather(*(dispatcher.submit("schema", "q", "q", None) for _ in range(5)))
+
+    answers = asyncio.run(ask())
+    assert answers == ["SELECT 'q';"] * 5
+    assert run_batch.calls == [["q"]]
+    assert dispatcher.stats["coalesced"] == 4
+
+
+def test_distinct_questions_are_batched_per_group():
+    run_batch = RecordingBatches()
+    dispatcher = ai_dispatch.AIDispatcher(run_batch, window=0.01, max_batch=2)
+
+    async def ask():
+        return await asyncio.gather(
+            dispatcher.submit("a", "q1", "q1", None),
+            dispatcher.submit("a", "q2", "q2", None),
+            dispatcher.submit("a", "q3", "q3", None),
+            dispatcher.submit("b", "q4", "q4", None),
+        )
+
+    answers = asyncio.run(ask())
+    assert answers == ["SELECT 'q1';", "SELECT 'q2';", "SELECT 'q3';", "SELECT 'q4';"]
+    assert sorted(run_batch.calls) == [["q1", "q2"], ["q3"], ["q4"]]
+
+
+# --- Multi-question answers ---
+
+def test_split_batch_answer():
+    text = "Here you go:\n### 1\nSELECT 1\n### 3\n```sql\nSELECT 3;\n```\n### 2\nno\n### 9\nSELECT 9;\n### 1\nSELECT 0;"
+    assert process.split_batch_answer(text, 4) == ["SELECT 1;", None, "SELECT 3;", None]
+
+
+def test_split_batch_answer_without_headers():
+    assert process.split_batch_answer("SELECT 1;", 2) == [None, None]
+
+
+def test_missing_parts_are_retried_alone(model, sample_db):
+    stub = model(DroppingModel(drop={2, 3}))
+    answers = asyncio.run(process._run_ai_batch(sample_db, ["one", "two", "three", "four"]))
+    assert answers == [ai_models.StubModel.answer(q) for q in ("one", "two", "three", "four")]
+    assert stub.calls == 3 # The batch, then one call for each missing part
+
+
+def test_failed_batch_call_falls_back_to_single_calls(model, sample_db):
+    stub = model(FailingBatchModel())
+    answers = asyncio.run(process._run_ai_batch(sample_db, ["one", "two"]))
+    assert answers == [ai_models.StubModel.answer(q) for q in ("one", "two")]
+    assert stub.calls == 3
+
+
+def test_complete_batch_answer_needs_one_call(model, sample_db):
+    stub = model(ai_models.StubModel())
+    answers = asyncio.run(process._run_ai_batch(sample_db, ["one", "two", "three"]))
+    assert answers == [ai_models.StubModel.answer(q) for q in ("one", "two", "three")]
+    assert stub.calls == 1
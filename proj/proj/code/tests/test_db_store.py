@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from routes import db_store
+from routes import process
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _store(data: bytes) -> str:
+    upload = db_store.Upload()
+    for i in range(0, len(data), 64): # Small chunks, so the header arrives in pieces
+        upload.write(data[i:i + 64])
+    return upload.finish()
+
+
+def _names(path: str):
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute("SELECT name FROM users ORDER BY id;")]
+
+
+# --- check_header ---
+
+def test_check_header_accepts_a_database(sample_db):
+    data = _read(sample_db)
+    db_store.check_header(data[:db_store.SQLITE_HEADER_SIZE], len(data))
+
+
+@pytest.mark.parametrize("corrupt, message", [
+    (lambda d: b"SQLite format 2\x00" + d[16:], "not a SQLite database"),
+    (lambda d: d[:16] + (1000).to_bytes(2, "big") + d[18:], "invalid page size"),
+    (lambda d: d[:18] + b"\x03" + d[19:], "unsupported file format"),
+    (lambda d: d[:-1], "truncated"),
+    (lambda d: d[:50], "not a SQLite database"),
+])
+def test_check_header_rejects(sample_db, corrupt, message):
+    data = corrupt(_read(sample_db))
+    with pytest.raises(db_store.InvalidDatabaseError, match=message):
+        db_store.check_header(data[:db_store.SQLITE_HEADER_SIZE], len(data))
+
+
+def test_upload_of_another_file_type_is_rejected_early():
+    upload = db_store.Upload()
+    with pytest.raises(db_store.InvalidDatabaseError):
+        upload.write(b"PK\x03\x04 not a database at all")
+    upload.abort()
+
+
+# --- Copy-on-write sessions ---
+
+def test_identical_uploads_share_one_blob(sample_db):
+    data = _read(sample_db)
+    first, second = _store(data), _store(data)
+    assert first == second
+    token_a, token_b = db_store.open_session(first), db_store.open_session(second)
+    assert db_store.session_path(token_a) == db_store.session_path(token_b) == db_store.blob_path(first)
+
+
+def test_first_write_gets_a_private_copy(sample_db):
+    sha256 = _store(_read(sample_db))
+    writer, reader = db_store.open_session(sha256), db_store.open_session(sha256)
+
+    path = db_store.writable_path(writer)
+    assert path == db_store.private_path(writer) != db_store.blob_path(sha256)
+    assert db_store.session_path(writer) == path
+    assert db_store.writable_path(writer) == path # Copied once
+
+    with sqlite3.connect(path) as conn:
+        conn.execute("DELETE FROM users WHERE name = 'bob';")
+    assert _names(path) == ["alice", "carol"]
+    assert db_store.session_path(reader) == db_store.blob_path(sha256)
+    assert _names(db_store.blob_path(sha256)) == ["alice", "bob", "carol"]
+
+
+def test_sessions_resolve_off_the_event_loop(sample_db, monkeypatch):
+    token = db_store.open_session(_store(_read(sample_db)))
+    threads = []
+    get = db_store.session_store.get
+    monkeypatch.setattr(db_store.session_store, "get", lambda t: threads.append(threading.current_thread()) or get(t))
+    assert asyncio.run(db_store.resolve_session(token)) == db_store.session_path(token)
+    assert threads[0] is not threading.main_thread()
+
+
+def test_writable_path_of_unknown_session():
+    assert db_store.writable_path("no-such-session") is None
+
+
+
+@pytest.mark.parametrize("sql", [
+    "WITH old AS (SELECT name FROM users WHERE age > 28) SELECT name FROM old ORDER BY name;",
+    "  select name FROM users WHERE age > 28 ORDER BY name;",
+    "EXPLAIN QUERY PLAN SELECT name FROM users;",
+    "PRAGMA table_info(users);",
+])
+def test_reads_share_the_upload(sample_db, sql):
+    token = db_store.open_session(_store(_read(sample_db)))
+    result, error = asyncio.run(process.run_session_sql(token, db_store.session_path(token), sql, "test", None))
+    assert error is None
+    assert result["rows"]
+    assert not os.path.exists(db_store.private_path(token))
+
+
+def test_write_gets_a_private_copy(sample_db):
+    sha256 = _store(_read(sample_db))
+    token = db_store.open_session(sha256)
+    sql = "DELETE FROM users WHERE age < 28;"
+    result, error = asyncio.run(process.run_session_sql(token, db_store.session_path(token), sql, "test", None))
+    assert (result, error) == ("1 rows affected.", None)
+    assert db_store.session_path(token) == db_store.private_path(token)
+    assert _names(db_store.private_path(token)) == ["alice", "carol"]
+    assert _names(db_store.blob_path(sha256)) == ["alice", "bob", "carol"]
+
+    result, error = asyncio.run(process.run_session_sql(
+        token, db_store.private_path(token), "INSERT INTO users (name, age) VALUES ('dave', 7) RETURNING name;", "test", None
+    ))
+    assert error is None and result["rows"] == [("dave",)]
+    assert _names(db_store.private_path(token)) == ["alice", "carol", "dave"]
+
+
+# --- Opening a session by hash ---
+
+@pytest.mark.parametrize("sha256", ["../x", "../sessions", "/root/package/sample_full", "ABC", "", "0" * 63 + "/"])
+def test_open_session_rejects_anything_but_a_digest(sha256):
+    assert db_store.open_session(sha256) is None
+    with pytest.raises(ValueError):
+        db_store.blob_path(sha256)
+
+
+@pytest.mark.parametrize("sha256", ["../x", "../sessions", "/etc/passwd", "..%2Fsessions"])
+def test_upload_by_hash_rejects_paths(sha256):
+    from fastapi.testclient import TestClient
+    import main
+
+    response = TestClient(main.app).post("/upload_db/by_hash", params={"sha256": sha256})
+    assert response.json() == {"error": "Unknown database; please upload the file."}
+
+
+# --- Streaming uploads ---
+
+def _client():
+    from fastapi.testclient import TestClient
+    import main
+
+    return TestClient(main.app)
+
+
+def _leftover_uploads():
+    return [name for name in os.listdir(db_store.STORE_FOLDER) if name.startswith(".upload-")]
+
+
+def test_upload_streams_the_file_part_into_the_store(sample_db):
+    data = _read(sample_db)
+    response = _client().post("/upload_db/", data={"note": "x"}, files={"file": ("sample.db", data)}).json()
+    assert response["sha256"] == hashlib.sha256(data).hexdigest()
+    assert _read(db_store.session_path(response["session_token"])) == data
+    assert not _leftover_uploads()
+
+
+@pytest.mark.parametrize("name, content, message", [
+    ("sample.txt", None, "Only .db files are allowed"),
+    ("sample.db", b"PK\x03\x04" * 100, "File is not a SQLite database."),
+    ("sample.db", lambda d: d[:16] + (1000).to_bytes(2, "big") + d[18:], "SQLite header has an invalid page size."),
+    ("sample.db", lambda d: d[:-10], "Database file is truncated."),
+])
+def test_bad_uploads_are_rejected(sample_db, name, content, message):
+    data = _read(sample_db)
+    if content is not None:
+        data = content(data) if callable(content) else content
+    response = _client().post("/upload_db/", files={"file": (name, data)})
+    assert response.json() == {"error": message}
+    assert not _leftover_uploads()
+
+
+def test_upload_without_a_file_part():
+    client = _client()
+    assert client.post("/upload_db/", data={"note": "x"}, files={"other": ("a.db", b"x")}).json() == {"error": "No file uploaded."}
+    assert "error" in client.post("/upload_db/", content=b"raw bytes").json()
@@ -0,0 +1,63 @@
+import json
+import os
+import random
+
+import pytest
+
+from functions import manualFunction
+from tests import reference_manual
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "corpus_v1.json")
+
+_VERBS = ("show", "get", "select", "fetch", "give", "giveme", "add", "insert", "create", "record", "update",
+          "change", "modify", "set", "delete", "remove", "wipe", "drop")
+_WORDS = ("all", "from", "where", "order by", "and", "or", "not", "is", "=", "as", "to", "in", "like",
+          "between", "equal to", "is not equal to", "greater than", "less than", "or equal to", "desc",
+          "asc", "descending", "a", "an", "the", "new", "users", "user", "products", "orders", "name",
+          "email", "age", "price", "names", "alice", "bob smith", "19.99", "30", "%example.com", "(4, 5)",
+          "'quoted'", '"dq"', ";", ",", ")", "(", "\n", "select")
+
+
+def _fuzzed_statement(rng):
+    if rng.random() < 0.5:
+        # Shaped like a real request, so the deeper branches are reached.
+        parts = [rng.choice(_VERBS), rng.choice(("all", "name", "name and email", "all names", "age, price")),
+                 "from", rng.choice(("users", "products", "orders"))]
+        if rng.random() < 0.7:
+            parts += ["where"] + [rng.choice(_WORDS) for _ in range(rng.randint(1, 8))]
+        if rng.random() < 0.4:
+            parts += ["order by", rng.choice(("age", "price desc", "name asc, age descending"))]
+    else:
+        parts = [rng.choice(_WORDS + _VERBS) for _ in range(rng.randint(1, 14))]
+    return rng.choice((" ", "  ", ", ")).join(parts)
+
+
+def _corpus_texts():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [s["text"] for s in json.load(f)["statements"]]
+
+
+@pytest.fixture(autouse=True)
+def cold_memo():
+    manualFunction._translate.cache_clear()
+    yield
+    manualFunction._translate.cache_clear()
+
+
+def test_corpus_matches_reference():
+    for text in _corpus_texts():
+        assert manualFunction.nl2sql([text]) == reference_manual.nl2sql([text]), text
+
+
+def test_fuzzed_statements_match_reference():
+    rng = random.Random(20240601)
+    for _ in range(20000):
+        text = _fuzzed_statement(rng)
+        assert manualFunction.nl2sql([text]) == reference_manual.nl2sql([text]), repr(text)
+
+
+def test_nl2sql_each_stays_aligned():
+    texts = ["show all from users", "", "add user", "how many users", "   "]
+    assert manualFunction.nl2sql_each(texts) == [
+        "SELECT * FROM users;", "unknown error", "unknown error", "unknown error", "unknown error",
+    ]
@@ -0,0 +1,42 @@
+import pytest
+
+from functions import query_guard
+from routes import process
+
+CARTESIAN = "SELECT a.name, b.name FROM users a, users b;"
+
+
+@pytest.fixture
+def guard(monkeypatch):
+    def configure(mode: str, max_join_rows: int = 4):
+        monkeypatch.setattr(query_guard, "QUERY_GUARD", mode)
+        monkeypatch.setattr(query_guard, "QUERY_MAX_JOIN_ROWS", max_join_rows)
+    return configure
+
+
+def test_cartesian_product_is_rejected(guard, sample_db):
+    guard("reject")
+    result, error = process.execute_sql(sample_db, CARTESIAN, "test", use_cache=False)
+    assert result is None
+    assert error.startswith("Query Guard: Cartesian product")
+
+
+def test_limited_statement_is_reported_as_executed(guard, sample_db, monkeypatch):
+    guard("limit")
+    monkeypatch.setattr(process.query_results, "RESULT_MAX_ROWS", 5)
+    result, error = process.execute_sql(sample_db, CARTESIAN, "test", use_cache=False)
+    assert error is None
+    executed_sql, result = process.with_next_token(result, "session", CARTESIAN)
+    assert executed_sql.startswith("SELECT * FROM (") and executed_sql.endswith(") LIMIT 5;")
+    assert len(result["rows"]) == 5
+    assert result["next_token"] is None
+    assert any("limited to 5 rows" in w for w in result["warnings"])
+
+
+def test_small_product_only_warns(guard, sample_db):
+    guard("reject", max_join_rows=100)
+    result, error = process.execute_sql(sample_db, CARTESIAN, "test", use_cache=False)
+    assert error is None
+    executed_sql, result = process.with_next_token(result, "session", CARTESIAN)
+    assert executed_sql == CARTESIAN
+    assert len(result["rows"]) == 9
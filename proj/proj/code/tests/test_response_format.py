@@ -0,0 +1,34 @@
+import pytest
+
+from functions import response_format
+
+ROWS = [[1, b"\xff\x00", "one"], ["two", None, 2.5], [None, b"\x01", 3]]
+
+
+def _payload():
+    return {"executed_sql": "SELECT a, b, c FROM t;", "result": {"headers": ["a", "b", "c"], "rows": ROWS, "next_token": None}}
+
+
+def test_columnar_layout():
+    result = response_format.to_columnar(_payload())["result"]
+    assert result["columns"] == [[1, "two", None], [b"\xff\x00", None, b"\x01"], ["one", 2.5, 3]]
+    assert result["row_count"] == 3
+    assert "rows" not in result
+
+
+def test_msgpack_keeps_blobs_raw():
+    msgpack = pytest.importorskip("msgpack")
+    response = response_format.respond(_payload(), "msgpack")
+    assert msgpack.unpackb(response.body)["result"]["columns"][1] == [b"\xff\x00", None, b"\x01"]
+
+
+def test_arrow_keeps_every_value_of_mixed_columns():
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+
+    response = response_format.respond(_payload(), "arrow")
+    table = pyarrow.ipc.open_stream(response.body).read_all()
+    assert table.schema.field("b").type == pyarrow.binary()
+    assert pyarrow.types.is_union(table.schema.field("a").type)
+    assert [field.name for field in table.schema.field("c").type] == ["text", "real", "integer"]
+    assert table.to_pylist() == [dict(zip("abc", row)) for row in ROWS]
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from functions import result_cache
+from routes import process
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT date, time FROM events;",
+    "SELECT changes FROM audit WHERE time > 3;",
+    "SELECT * FROM users ORDER BY date DESC;",
+    "SELECT randomness FROM t;",
+])
+def test_columns_named_like_functions_are_cacheable(sql):
+    assert result_cache.cacheable(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT random();",
+    "SELECT * FROM events WHERE day = date('now');",
+    "SELECT DATETIME ('now');",
+    "SELECT last_insert_rowid();",
+    "SELECT * FROM events WHERE day = CURRENT_DATE;",
+    "SELECT current_timestamp;",
+])
+def test_volatile_sql_is_not_cacheable(sql):
+    assert not result_cache.cacheable(sql)
+
+
+def test_entry_goes_stale_when_another_connection_writes(sample_db):
+    sql = "SELECT name FROM users ORDER BY id;"
+    cached, version = result_cache.get(sample_db, sql, 0)
+    assert cached is None
+    result_cache.put(sample_db, sql, 0, version, {"headers": ["name"], "rows": [("alice",)], "next_offset": None})
+    assert result_cache.get(sample_db, sql, 0)[0]["rows"] == [("alice",)]
+
+    with sqlite3.connect(sample_db) as conn:
+        conn.execute("UPDATE users SET age = age + 1;")
+    assert result_cache.get(sample_db, sql, 0)[0] is None
+
+
+def test_select_after_write_sees_the_write(sample_db):
+    sql = "SELECT name FROM users ORDER BY id;"
+    # The pool's first connection switches the file to WAL, which counts as a write.
+    process.execute_sql(sample_db, sql, "test")
+    first, error = process.execute_sql(sample_db, sql, "test")
+    assert error is None
+    hits = result_cache.stats["hits"]
+    assert process.execute_sql(sample_db, sql, "test") == (first, None)
+    assert result_cache.stats["hits"] == hits + 1
+
+    assert process.execute_sql(sample_db, "DELETE FROM users WHERE name = 'bob';", "test") == ("1 rows affected.", None)
+    after, error = process.execute_sql(sample_db, sql, "test")
+    assert error is None
+    assert [row[0] for row in after["rows"]] == ["alice", "carol"]
+    assert result_cache.stats["hits"] == hits + 1
@@ -0,0 +1,62 @@
+import pytest
+
+from functions import schema_index
+
+SCHEMA = {
+    "users": ["id", "name", "age", "email"],
+    "orders": ["id", "user_id", "total", "created_at"],
+    "order_items": ["id", "order_id", "product_id", "quantity"],
+    "products": ["id", "title", "price"],
+    "invoices": ["id", "order_id", "amount"],
+    **{f"metrics_{n}": ["id", "value", "recorded_at"] for n in range(300)},
+}
+FOREIGN_KEYS = {"orders": ["users"], "order_items": ["orders", "products"], "invoices": ["orders"]}
+
+
+@pytest.fixture
+def index():
+    return schema_index.SchemaIndex(SCHEMA, FOREIGN_KEYS)
+
+
+def test_tokenize():
+    assert schema_index.tokenize("userAccounts_2024 v2") == ["user", "account", "v2"]
+    assert schema_index.tokenize("list the categories") == ["category"]
+
+
+def test_best_match_ranks_first(index):
+    assert index.score("user emails")[0][0] == "users"
+    assert index.score("what is the weather") == []
+
+
+def test_numbers_in_the_question_do_not_pick_tables(index):
+    assert "metrics_30" not in dict(index.score("list users older than 30"))
+    assert index.select(["list users older than 30"], top_k=1) == ["users", "orders"]
+
+
+def test_foreign_keys_are_followed_both_ways(index):
+    # order_items references products; products references nothing.
+    assert index.select(["product prices"], top_k=1) == ["order_items", "products"]
+
+
+def test_neighbours_stop_at_max_tables(index):
+    assert index.select(["users by email"], top_k=1, max_tables=1) == ["users"]
+
+
+def test_too_many_matches_fall_back(index):
+    assert index.select(["orders"], top_k=6) is not None
+    assert index.select(["orders"], top_k=6, max_tables=2) is None
+
+
+def test_low_score_falls_back(index, monkeypatch):
+    assert index.select(["what is the weather"]) is None
+    assert index.select(["users", "what is the weather"]) is None # Every question must match
+    monkeypatch.setattr(schema_index, "SCHEMA_PRUNE_MIN_SCORE", 100.0)
+    assert index.select(["user emails"]) is None
+
+
+def test_prune(monkeypatch):
+    pruned = schema_index.prune("fingerprint", SCHEMA, FOREIGN_KEYS, ["user emails"])
+    assert set(pruned) <= set(SCHEMA) and "users" in pruned
+    assert pruned["users"] == SCHEMA["users"]
+    small = {table: SCHEMA[table] for table in ["users", "orders"]}
+    assert schema_index.prune("small", small, {}, ["user emails"]) is None
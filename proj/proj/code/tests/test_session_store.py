@@ -0,0 +1,51 @@
+import pytest
+
+from routes import session_store
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two stores on one file, standing in for two worker processes."""
+    path = str(tmp_path / "sessions.db")
+    return session_store.SQLiteSessionStore(path), session_store.SQLiteSessionStore(path)
+
+
+def _record(**fields):
+    return {"blob": "abc", "private": False, "last_used": 1.0, **fields}
+
+
+def test_other_connection_sees_new_session(stores):
+    a, b = stores
+    assert b.get("t") is None # Cached as missing
+    a.put("t", _record())
+    assert b.get("t") == _record()
+
+
+def test_cached_record_is_dropped_after_another_connection_writes(stores):
+    a, b = stores
+    a.put("t", _record())
+    assert b.get("t") == _record()
+    a.update("t", private=True, last_used=2.0)
+    assert b.get("t") == _record(private=True, last_used=2.0)
+    b.delete("t")
+    assert a.get("t") is None
+
+
+def test_updates_from_this_connection_stay_cached(stores):
+    a, _ = stores
+    a.put("t", _record())
+    a.update("t", last_used=5.0)
+    assert a.get("t") == _record(last_used=5.0)
+    assert a.items() == [("t", _record(last_used=5.0))]
+
+
+def test_secret_is_shared(stores):
+    a, b = stores
+    assert a.secret("result_token") == b.secret("result_token")
+    assert a.secret("result_token") != a.secret("other")
+    assert len(a.secret("result_token")) == 64
+
+
+def test_memory_store_secret_is_stable():
+    store = session_store.MemorySessionStore()
+    assert store.secret("x") == store.secret("x")
@@ -0,0 +1,47 @@
+import asyncio
+import sys
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from functions import telemetry
+from routes import stages
+
+
+def test_stage_abandoned_after_a_timeout_may_still_record():
+    app = FastAPI()
+    app.add_middleware(telemetry.TimingMiddleware)
+    release, filled, finished = threading.Event(), threading.Event(), threading.Event()
+
+    def late_worker():
+        release.wait()
+        for i in range(50000): # A long Server-Timing header takes a while to build...
+            with telemetry.timer(f"early_{i}"):
+                pass
+        filled.set()
+        for i in range(50000): # ...and the worker keeps recording while it is built.
+            with telemetry.timer(f"late_{i}"):
+                pass
+        finished.set()
+
+    @app.get("/slow")
+    async def slow():
+        try:
+            await stages.run_stage(stages.io_executor, 0.01, None, late_worker)
+        except stages.StageTimeout:
+            pass
+        release.set()
+        await asyncio.to_thread(filled.wait, 5)
+        return {"ok": True}
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5) # Switch threads often, so the worker runs during the header
+    try:
+        with TestClient(app) as client:
+            response = client.get("/slow")
+    finally:
+        sys.setswitchinterval(interval)
+    assert response.status_code == 200
+    assert "early_0;dur=" in response.headers["server-timing"]
+    assert finished.wait(5)